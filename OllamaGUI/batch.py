@@ -0,0 +1,308 @@
+'''
+Run a batch of prompts through an LLM without the GUI.
+
+Prompts are read from a file or stdin, either JSONL (one prompt per line, a
+JSON string or an object with "prompt" or "messages" and optionally "id",
+"model" and "options") or Markdown (the "User:" turns of a transcript saved
+by the GUI, or blocks separated by "---" lines). They are sent concurrently,
+at most --workers at a time, and each result is written as one JSON line as
+soon as it arrives. Throughput is printed to stderr at the end.
+
+Results are keyed by the prompt's "id" ("prompt-<n>", its position in the
+input, if it has none; ids must be unique), so an interrupted batch can be
+finished with --resume, which skips every prompt that already has a
+successful result in the output file.
+
+    python batch.py prompts.jsonl -o results.jsonl --model codellama --workers 4
+    cat review.md | python batch.py - --temperature 0 --cache
+
+Never imports tkinter, runs fine on machines without a display.
+'''
+
+# src/batch.py
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from utils.errors import LLMConnectionError
+from utils.providers import make_provider
+from utils.cancel import CancelToken
+from utils.chat_context import estimate_tokens
+from utils.conversation import Conversation
+from utils.response_cache import ResponseCache, default_cache_path, is_deterministic, make_key
+from utils.warmup import DEFAULT_KEEP_ALIVE
+
+
+#%% Reading prompts
+def read_jsonl(lines):
+    '''Yield prompt dicts from JSONL lines. Blank lines are skipped.'''
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}") from e
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict) or not ("prompt" in item or "messages" in item):
+            raise ValueError(f'Line {number} has no "prompt" or "messages"')
+        yield item
+
+
+def read_markdown(text):
+    '''
+    Yield prompt dicts from Markdown: the "User:" turns of a saved
+    transcript, or else every block between "---" lines.
+    '''
+    conversation = Conversation.from_markdown(text)
+    if any(message.role != "text" for message in conversation): # a GUI transcript
+        for message in conversation:
+            if message.role == "user" and message.content.strip():
+                yield {"prompt": message.content.strip()}
+        return
+    for block in re.split(r"^-{3,}\s*$", text, flags=re.MULTILINE):
+        if block.strip():
+            yield {"prompt": block.strip()}
+
+
+def read_prompts(path, fmt=None):
+    '''
+    Yield (id, prompt dict) for every prompt in `path` ("-" for stdin).
+    `fmt` is "jsonl" or "md", guessed from the file name if None. Prompts
+    without an "id" get "prompt-<n>" (1-based). Raises ValueError on a
+    duplicate id, --resume could not tell the prompts apart.
+    '''
+    if fmt is None:
+        fmt = "md" if path.lower().endswith((".md", ".markdown", ".txt")) else "jsonl"
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        items = read_jsonl(stream) if fmt == "jsonl" else read_markdown(stream.read())
+        seen = set()
+        for index, item in enumerate(items, start=1):
+            prompt_id = str(item["id"]) if "id" in item else f"prompt-{index}"
+            if prompt_id in seen:
+                raise ValueError(f'Prompt {index} has the same id as an earlier one: {prompt_id!r}')
+            seen.add(prompt_id)
+            yield prompt_id, item
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def completed_ids(path):
+    '''Ids with a successful result in an existing output file, for --resume.'''
+    done = set()
+    if path == "-" or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError: # cut off when the last run was interrupted
+                continue
+            if not record.get("error"):
+                done.add(str(record.get("id")))
+    return done
+
+
+#%% Running prompts
+class BatchRunner:
+    """
+    Sends prompts concurrently and collects throughput statistics.
+
+    Parameters
+    ----------
+    provider : LLMProvider
+    model : str
+        Used for prompts that don't name their own.
+    options : dict, optional
+        Model options, merged under each prompt's own "options".
+    workers : int, optional
+        Prompts in flight at once.
+    cache : ResponseCache, optional
+        Answer deterministic prompts from (and store them in) this cache.
+    keep_alive : str, optional
+    """
+    def __init__(self, provider, model, options=None, workers=4, cache=None, keep_alive=DEFAULT_KEEP_ALIVE):
+        self.provider = provider
+        self.model = model
+        self.options = dict(options or {})
+        self.workers = workers
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.cancel = CancelToken() # cancelled on Ctrl+C, aborts everything in flight
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.cached = 0
+        self.tokens = 0
+        self.latency = 0.0 # summed over completed prompts
+
+    def run_one(self, prompt_id, item):
+        '''Send one prompt, returns its result record.'''
+        model = item.get("model", self.model)
+        options = dict(self.options, **item.get("options", {}))
+        prompt, messages = item.get("prompt"), item.get("messages")
+        record = {"id": prompt_id, "model": model}
+        if prompt is not None:
+            record["prompt"] = prompt
+        result = {}
+        start = time.perf_counter()
+        # the prompt's own token, so the backend's abort callbacks (and connections) go away with it
+        cancel = CancelToken()
+        self.cancel.on_cancel(cancel.cancel)
+        try:
+            key = None
+            if self.cache is not None and is_deterministic(options):
+                key = make_key(self.provider.model_digest(model), options,
+                               messages or [{"role": "user", "content": prompt}])
+            cached = self.cache.get(key) if key else None
+            if cached is not None:
+                response, result = cached[0], dict(cached[1], cached=True)
+            else:
+                response = self.provider.generate(model, prompt, messages, options or None,
+                                                  keep_alive=self.keep_alive, cancel=cancel, result=result)
+                if self.cancel.cancelled: # partial, leave it for --resume
+                    raise LLMConnectionError("Interrupted")
+                if key and result.get("done"):
+                    self.cache.put(key, response, {k: v for k, v in result.items() if k not in ("response", "message")})
+        except (LLMConnectionError, OSError) as e: # OSError: e.g. the CLI fallback's podman is not installed
+            record.update(error=str(e) or repr(e), elapsed=round(time.perf_counter() - start, 3))
+            if not self.cancel.cancelled:
+                with self._lock:
+                    self.failed += 1
+            return record
+        finally:
+            self.cancel.remove_callback(cancel.cancel)
+
+        elapsed = time.perf_counter() - start
+        tokens = result.get("eval_count") or estimate_tokens(response)
+        record.update(response=response, elapsed=round(elapsed, 3), eval_count=tokens)
+        for field in ("prompt_eval_count", "total_duration", "load_duration", "eval_duration", "cached"):
+            if field in result:
+                record[field] = result[field]
+        with self._lock:
+            self.completed += 1
+            self.tokens += tokens
+            self.latency += elapsed
+            self.cached += bool(result.get("cached"))
+        return record
+
+    def run(self, prompts, write):
+        '''
+        Run every (id, prompt dict) in `prompts` and call write(record) for
+        each result, in completion order. Returns the wall time in seconds.
+        Only `workers` prompts are read ahead, so stdin can be streamed.
+        '''
+        start = time.perf_counter()
+        slots = threading.BoundedSemaphore(self.workers)
+
+        def task(prompt_id, item):
+            try:
+                return self.run_one(prompt_id, item)
+            finally:
+                slots.release()
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="ollamagui-batch") as pool:
+            pending = set()
+            try:
+                for prompt_id, item in prompts:
+                    slots.acquire()
+                    pending.add(pool.submit(task, prompt_id, item))
+                    for future in [f for f in pending if f.done()]:
+                        pending.discard(future) # before writing, so Ctrl+C can't write it twice
+                        write(future.result())
+                for future in concurrent.futures.as_completed(set(pending)):
+                    pending.discard(future)
+                    write(future.result())
+            except KeyboardInterrupt:
+                print('\nInterrupted, stopping the prompts in flight (use --resume to finish)', file=sys.stderr)
+                self.cancel.cancel()
+                for future in pending:
+                    record = future.result()
+                    if not record.get("error"): # the interrupted ones are left for --resume
+                        write(record)
+        return time.perf_counter() - start
+
+    def summary(self, wall_time):
+        '''Throughput statistics as printable text.'''
+        wall_time = max(wall_time, 1e-9)
+        lines = [
+            f'Prompts: {self.completed} done, {self.failed} failed, {self.cached} from cache',
+            f'Wall time: {wall_time:.2f} s',
+            f'Throughput: {self.completed / wall_time:.2f} prompts/s, {self.tokens / wall_time:.1f} tokens/s',
+        ]
+        if self.completed:
+            lines.append(f'Mean latency: {self.latency / self.completed:.2f} s per prompt')
+        return "\n".join(lines)
+
+
+#%% Command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a batch of prompts through an LLM, results as JSONL.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL or Markdown file, - for stdin (default)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results file, - for stdout (default)")
+    parser.add_argument("-f", "--format", choices=("jsonl", "md"), help="input format (default: from the file name)")
+    parser.add_argument("-m", "--model", default="codellama")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="prompts in flight at once (default 4)")
+    parser.add_argument("--provider", help="ollama, ollama-http, ollama-cli, openai or mock (default: OLLAMAGUI_PROVIDER)")
+    parser.add_argument("--num-ctx", type=int, help="context window in tokens")
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--cache", action="store_true", help="reuse cached answers to deterministic prompts")
+    parser.add_argument("--resume", action="store_true", help="skip prompts already answered in the output file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Entry point for the batch runner"""
+    args = parse_args(argv)
+    options = {name: value for name, value in
+               (("num_ctx", args.num_ctx), ("temperature", args.temperature), ("seed", args.seed))
+               if value is not None}
+    cache = ResponseCache(default_cache_path()) if args.cache else None
+    runner = BatchRunner(make_provider(args.provider), args.model, options, max(1, args.workers), cache)
+
+    skip = completed_ids(args.output) if args.resume else set()
+    if skip:
+        print(f'Resuming, {len(skip)} prompts already done', file=sys.stderr)
+    prompts = ((prompt_id, item) for prompt_id, item in read_prompts(args.input, args.format) if prompt_id not in skip)
+
+    if args.output == "-":
+        output = sys.stdout
+    else:
+        output = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    lock = threading.Lock()
+
+    def write(record):
+        with lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush() # results survive an interrupted run, see --resume
+        if record.get("error"):
+            print(f'{record["id"]}: {record["error"]}', file=sys.stderr)
+
+    try:
+        wall_time = runner.run(prompts, write)
+    except ValueError as e: # malformed input
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if cache is not None:
+            cache.close()
+    print(runner.summary(wall_time), file=sys.stderr)
+    if runner.cancel.cancelled:
+        return 130
+    return 1 if runner.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
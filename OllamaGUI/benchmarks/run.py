@@ -0,0 +1,261 @@
+# src/benchmarks/run.py
+'''
+Latency and throughput benchmarks for the LLM backends.
+
+For every backend (HTTP API, CLI subprocess) and model it measures:
+
+- cold: the first request after the model was unloaded (includes loading)
+- warm: time to first token, end to end latency and generation speed
+- concurrency: total throughput and tail latency with 1, 2, 4... requests at once
+
+By default everything runs offline against the stub server in
+stub_server.py (and the stub CLI in stub_ollama.py), whose timings are fixed,
+so differences between runs come from our client code. Results are written
+as JSON and can be compared against a stored baseline; metrics that got
+worse by more than --tolerance are reported and the exit code is 1.
+
+Run from the OllamaGUI directory:
+
+    python -m benchmarks.run                         # offline, prints a summary
+    python -m benchmarks.run --compare               # ... and checks benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline         # store this run as the new baseline
+    python -m benchmarks.run --server http://127.0.0.1:11434 --models codellama \\
+        --cli-prefix "podman exec ollama ollama"      # a real server
+'''
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shlex
+import statistics
+import sys
+import time
+import urllib.parse
+
+from utils.chat_context import estimate_tokens
+from utils.ollama_http import OllamaHTTPClient
+from utils.providers import OllamaHTTPProvider, OllamaCLIProvider
+
+from .stub_server import StubOllamaServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "baseline.json")
+STUB_CLI = os.path.join(HERE, "stub_ollama.py")
+
+PROMPT = "Explain what a Python generator is in one short paragraph."
+
+
+#%% Measurements
+def percentile(values, fraction):
+    '''Nearest rank percentile, fine for the small samples taken here.'''
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def measure(provider, model, options=None, prompt=PROMPT):
+    '''One streamed request. Returns ttft and latency in seconds and the token count.'''
+    result = {}
+    parts = []
+    ttft = None
+    start = time.perf_counter()
+    for text in provider.stream(model, prompt, options=options, result=result):
+        if text and ttft is None:
+            ttft = time.perf_counter() - start
+        parts.append(text)
+    latency = time.perf_counter() - start
+    tokens = result.get("eval_count") or estimate_tokens("".join(parts))
+    return {"ttft": latency if ttft is None else ttft, "latency": latency, "tokens": tokens}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def _rate(sample):
+    '''Generation speed after the first token, tokens/s.'''
+    return sample["tokens"] / max(sample["latency"] - sample["ttft"], 1e-9)
+
+
+def bench_cold(provider, model, unload, repeats, options):
+    samples = []
+    for _ in range(repeats):
+        unload(model)
+        samples.append(measure(provider, model, options))
+    return {
+        "ttft_ms": _ms(statistics.median(s["ttft"] for s in samples)),
+        "latency_ms": _ms(statistics.median(s["latency"] for s in samples)),
+    }
+
+
+def bench_warm(provider, model, repeats, options):
+    measure(provider, model, options) # make sure the model is loaded
+    samples = [measure(provider, model, options) for _ in range(repeats)]
+    return {
+        "ttft_ms": _ms(statistics.median(s["ttft"] for s in samples)),
+        "ttft_p95_ms": _ms(percentile([s["ttft"] for s in samples], 0.95)),
+        "latency_ms": _ms(statistics.median(s["latency"] for s in samples)),
+        "latency_p95_ms": _ms(percentile([s["latency"] for s in samples], 0.95)),
+        "tokens_per_s": round(statistics.median(_rate(s) for s in samples), 1),
+    }
+
+
+def bench_concurrency(provider, model, level, per_level, options):
+    '''`level` requests at a time, `level * per_level` in total.'''
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(level) as pool:
+        samples = list(pool.map(lambda _: measure(provider, model, options), range(level * per_level)))
+    wall = time.perf_counter() - start
+    return {
+        "throughput_tokens_per_s": round(sum(s["tokens"] for s in samples) / wall, 1),
+        "requests_per_s": round(len(samples) / wall, 2),
+        "latency_p95_ms": _ms(percentile([s["latency"] for s in samples], 0.95)),
+    }
+
+
+def run_suite(backends, models, unload, args):
+    '''Returns a list of {"backend", "model", "scenario", "metrics"} records.'''
+    options = {"num_predict": args.tokens} if args.tokens else None
+    records = []
+
+    def record(backend, model, scenario, metrics):
+        records.append({"backend": backend, "model": model, "scenario": scenario, "metrics": metrics})
+        shown = ", ".join(f"{k}={v}" for k, v in metrics.items())
+        print(f'{backend:5} {model:12} {scenario:14} {shown}', file=sys.stderr)
+
+    for name, provider in backends.items():
+        for model in models:
+            record(name, model, "cold", bench_cold(provider, model, unload, args.cold_repeats, options))
+            record(name, model, "warm", bench_warm(provider, model, args.repeats, options))
+            for level in args.concurrency:
+                record(name, model, f"concurrency-{level}",
+                       bench_concurrency(provider, model, level, args.per_level, options))
+    return records
+
+
+#%% Baseline comparison
+def flatten(report):
+    '''{"backend/model/scenario/metric": value} for a results report.'''
+    return {f'{r["backend"]}/{r["model"]}/{r["scenario"]}/{metric}': value
+            for r in report["results"] for metric, value in r["metrics"].items()}
+
+
+def lower_is_better(metric):
+    return metric.endswith("_ms")
+
+
+def compare(report, baseline, tolerance):
+    '''
+    Returns (lines, regressions): a line per metric found in both reports,
+    and the metrics that got worse by more than `tolerance` (a fraction).
+    '''
+    current, previous = flatten(report), flatten(baseline)
+    lines, regressions = [], []
+    for key in sorted(current.keys() & previous.keys()):
+        new, old = current[key], previous[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change > tolerance if lower_is_better(key) else change < -tolerance
+        flag = "  REGRESSION" if worse else ""
+        lines.append(f'{key:60} {old:>10} -> {new:>10} ({change:+.0%}){flag}')
+        if worse:
+            regressions.append(key)
+    return lines, regressions
+
+
+#%% Command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LLM backends (offline stub server by default).")
+    parser.add_argument("--server", help="benchmark a real Ollama server at this URL instead of the stub")
+    parser.add_argument("--models", default="stub", help="comma separated (default: stub)")
+    parser.add_argument("--backends", default="http,cli", help="comma separated: http, cli (default: both)")
+    parser.add_argument("--cli-prefix", help='command in front of "run MODEL PROMPT" (default: the stub CLI, or "ollama")')
+    parser.add_argument("--repeats", type=int, default=5, help="warm requests per model (default 5)")
+    parser.add_argument("--cold-repeats", type=int, default=2)
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma separated levels (default 1,2,4,8)")
+    parser.add_argument("--per-level", type=int, default=2, help="requests per concurrent worker (default 2)")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens to generate per request (num_predict)")
+    parser.add_argument("-o", "--output", default="benchmark-results.json")
+    parser.add_argument("--compare", nargs="?", const=BASELINE, metavar="BASELINE",
+                        help="compare against a baseline (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE, metavar="BASELINE",
+                        help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before flagging a regression (default 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level]
+    return args
+
+
+def main(argv=None):
+    """Entry point for the benchmarks"""
+    args = parse_args(argv)
+    stub = None
+    url = args.server
+    if url is None:
+        stub = StubOllamaServer(load_delay=0.3, ttft=0.02, token_delay=0.005,
+                                num_parallel=max(args.concurrency)).start()
+        url = stub.url
+    parts = urllib.parse.urlsplit(url)
+    client = OllamaHTTPClient(parts.hostname, parts.port or 11434, pool_size=max(args.concurrency))
+
+    if args.cli_prefix:
+        cli_prefix = shlex.split(args.cli_prefix)
+    elif stub is not None:
+        cli_prefix = [sys.executable, STUB_CLI, "--host", url]
+    else:
+        cli_prefix = ["ollama"]
+    available = {"http": OllamaHTTPProvider(client), "cli": OllamaCLIProvider(prefix=cli_prefix)}
+    backends = {name: available[name] for name in args.backends.split(",") if name}
+
+    def unload(model):
+        client.generate(model, "", keep_alive=0)
+
+    try:
+        # the backends' debug prints would drown the results
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run_suite(backends, [m for m in args.models.split(",") if m], unload, args)
+    finally:
+        client.close()
+        if stub is not None:
+            stub.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": "stub" if stub is not None else url,
+            "tokens": args.tokens, "repeats": args.repeats, "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f'Baseline saved to {args.save_baseline}', file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["meta"].get("server") != report["meta"]["server"]:
+            print('Warning: baseline was measured against a different server', file=sys.stderr)
+        lines, regressions = compare(report, baseline, args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%}', file=sys.stderr)
+            return 1
+        print('No regressions', file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# src/benchmarks/stub_ollama.py
+'''
+Stand-in for the `ollama` command line client, for benchmarking the CLI
+backend offline.
+
+Like the real `ollama run`, it is a separate process that connects to the
+server, streams the response to stdout and exits, so the benchmark pays the
+same process start-up and connection costs. Only the standard library is
+imported, to keep start-up honest.
+
+    python stub_ollama.py --host http://127.0.0.1:11435 run MODEL PROMPT
+    python stub_ollama.py --host http://127.0.0.1:11435 list
+'''
+
+import argparse
+import http.client
+import json
+import sys
+import urllib.parse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Minimal ollama CLI stand-in")
+    parser.add_argument("--host", default="http://127.0.0.1:11434")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run")
+    run.add_argument("model")
+    run.add_argument("prompt")
+    commands.add_parser("list")
+    args = parser.parse_args(argv)
+
+    url = urllib.parse.urlsplit(args.host)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 11434)
+    try:
+        if args.command == "list":
+            conn.request("GET", "/api/tags")
+            models = json.loads(conn.getresponse().read()).get("models", [])
+            print("NAME\tID")
+            for model in models:
+                print(f'{model["name"]}\t{model.get("digest", "")[:12]}')
+            return 0
+
+        body = json.dumps({"model": args.model, "prompt": args.prompt, "stream": True})
+        conn.request("POST", "/api/generate", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            print(f"Error: {response.read().decode(errors='replace')}", file=sys.stderr)
+            return 1
+        out = sys.stdout.buffer
+        for line in response:
+            chunk = json.loads(line)
+            if "error" in chunk:
+                print(f"Error: {chunk['error']}", file=sys.stderr)
+                return 1
+            out.write(chunk.get("response", "").encode("utf-8"))
+            out.flush() # token by token, like the real client
+        out.write(b"\n")
+        return 0
+    except OSError as e:
+        print(f"Error: could not connect to ollama app, is it running? ({e})", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# src/benchmarks/stub_server.py
+'''
+Offline stand-in for an Ollama server, for benchmarks and tests.
+
+Implements the parts of the REST API the app uses (/api/version, /api/tags,
+/api/ps, /api/generate and /api/chat, streamed or not) with a simulated
+model: a load delay the first time a model is used (cold start), a delay
+before the first token, a fixed delay per token and a limited number of
+requests generated in parallel (OLLAMA_NUM_PARALLEL), with the rest queued.
+Timings are deterministic, so results only vary with the client side code.
+
+    python -m benchmarks.stub_server --port 11435
+'''
+
+import argparse
+import http.server
+import json
+import socket
+import threading
+import time
+
+from utils.warmup import keep_alive_seconds
+
+# Every simulated token is 4 characters, so estimate_tokens() counts them exactly
+WORDS = ("the ", "cat ", "sat ", "on ", "a ", "mat ", "and ", "ate ")
+
+
+def _ns(seconds):
+    return int(seconds * 1e9)
+
+
+class StubOllamaServer:
+    """
+    Simulated Ollama server running on a background thread.
+
+    Parameters
+    ----------
+    host : str, optional
+    port : int, optional
+        0 picks a free port, see `port` once started.
+    load_delay : float, optional
+        Seconds to load a model that isn't in memory.
+    ttft : float, optional
+        Seconds of prompt processing before the first token.
+    token_delay : float, optional
+        Seconds per generated token.
+    tokens : int, optional
+        Tokens per response, unless the request sets options.num_predict.
+    num_parallel : int, optional
+        Requests generated at once, later ones wait for a slot.
+    """
+    def __init__(self, host="127.0.0.1", port=0, load_delay=0.5, ttft=0.02, token_delay=0.005,
+                 tokens=64, num_parallel=4):
+        self.load_delay = load_delay
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.num_parallel = num_parallel
+        self._slots = threading.BoundedSemaphore(num_parallel)
+        self._loaded = {} # model -> expiry (time.monotonic()), None = forever
+        self._load_lock = threading.Lock()
+        self.requests = 0
+
+        stub = self
+        class Handler(_Handler):
+            server_stub = stub
+        self._httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    #%% Simulated model
+    def loaded(self):
+        now = time.monotonic()
+        return [m for m, expiry in self._loaded.items() if expiry is None or expiry > now]
+
+    def unload(self, model=None):
+        with self._load_lock:
+            if model is None:
+                self._loaded.clear()
+            else:
+                self._loaded.pop(model, None)
+
+    def load(self, model):
+        '''Returns the seconds spent loading, 0 if it was already in memory.'''
+        with self._load_lock: # concurrent cold requests wait for the same load
+            if model in self.loaded():
+                return 0.0
+            time.sleep(self.load_delay)
+            self._loaded[model] = None
+            return self.load_delay
+
+    def keep(self, model, keep_alive):
+        '''Apply a request's keep_alive once it is done.'''
+        seconds = 300.0 if keep_alive is None else keep_alive_seconds(keep_alive)
+        with self._load_lock:
+            if seconds == 0:
+                self._loaded.pop(model, None)
+            elif model in self._loaded:
+                self._loaded[model] = None if seconds < 0 else time.monotonic() + seconds
+
+    def generate(self, request):
+        '''Yield (text, final fields or None) for a generate/chat request.'''
+        model = request.get("model", "")
+        options = request.get("options") or {}
+        if "messages" in request:
+            prompt = " ".join(m.get("content", "") for m in request["messages"])
+        else:
+            prompt = request.get("prompt", "")
+        start = time.monotonic()
+        with self._slots:
+            self.requests += 1
+            load_seconds = self.load(model)
+            if not prompt and "messages" not in request: # load only
+                self.keep(model, request.get("keep_alive"))
+                yield "", {"load_duration": _ns(load_seconds), "total_duration": _ns(time.monotonic() - start)}
+                return
+            time.sleep(self.ttft)
+            prompt_done = time.monotonic()
+            count = int(options.get("num_predict", self.tokens))
+            for i in range(count):
+                if i:
+                    time.sleep(self.token_delay)
+                yield WORDS[i % len(WORDS)], None
+            end = time.monotonic()
+            self.keep(model, request.get("keep_alive"))
+        prompt_tokens = max(1, len(prompt) // 4)
+        context = list(request.get("context") or []) + list(range(prompt_tokens + count))
+        yield "", {
+            "total_duration": _ns(end - start), "load_duration": _ns(load_seconds),
+            "prompt_eval_count": prompt_tokens, "prompt_eval_duration": _ns(self.ttft),
+            "eval_count": count, "eval_duration": _ns(end - prompt_done), "context": context,
+        }
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real server
+    server_stub = None
+
+    def setup(self):
+        super().setup()
+        # Go's net/http (the real server) disables Nagle, so small chunks go out right away
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args): # quiet
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub = self.server_stub
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            models = sorted(set(stub.loaded()) | {"stub:latest"})
+            self._send_json({"models": [{"name": m, "digest": f"stub-{m}"} for m in models]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": m} for m in stub.loaded()]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json({"error": "invalid JSON"}, 400)
+        if self.path not in ("/api/generate", "/api/chat"):
+            return self._send_json({"error": "not found"}, 404)
+        chat = self.path == "/api/chat"
+        model = request.get("model", "")
+
+        def chunk(text, final):
+            data = {"model": model, "done": final is not None}
+            if chat:
+                data["message"] = {"role": "assistant", "content": text}
+            else:
+                data["response"] = text
+            if final:
+                data.update(final)
+                if chat:
+                    data.pop("context", None)
+            return data
+
+        pieces = self.server_stub.generate(request)
+        if not request.get("stream", True):
+            text, final = [], None
+            for piece, final in pieces:
+                text.append(piece)
+            return self._send_json(chunk("".join(text), final or {}))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece, final in pieces:
+                line = json.dumps(chunk(piece, final)).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError: # client went away (cancelled), stop generating
+            pieces.close()
+            self.close_connection = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-delay", type=float, default=0.5)
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--num-parallel", type=int, default=4)
+    args = parser.parse_args(argv)
+    server = StubOllamaServer(port=args.port, load_delay=args.load_delay, ttft=args.ttft,
+                              token_delay=args.token_delay, tokens=args.tokens, num_parallel=args.num_parallel)
+    print(f'Stub Ollama listening on {server.url}')
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
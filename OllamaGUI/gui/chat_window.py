@@ -1,16 +1,76 @@
 # src/gui/chat_window.py
-import tkinter as tk
-from tkinter import scrolledtext, filedialog, messagebox
+import tkinter as tk # the dialogs (filedialog, messagebox...) are imported when first used, for a faster start
 import datetime
 import os
+import sys
+# the "." is require if used as a module but breaks thing if tested alone.
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # for utils
+    from stall_watchdog import StallWatchdog
+    from transcript import TranscriptView
+else:
+    from .stall_watchdog import StallWatchdog
+    from .transcript import TranscriptView
+from utils.conversation import Conversation
+from utils.search import SearchIndex
+
+#%% One Tk interpreter for every window
+_root = None
+
+def _app_root():
+    """The hidden tk.Tk every ChatWindow is a Toplevel of, created with the first window"""
+    global _root
+    if _root is None:
+        _root = tk.Tk()
+        _root.withdraw()
+        # Opt-in UI stall diagnostics (OLLAMAGUI_WATCHDOG=1), see gui/stall_watchdog.py.
+        # One for all windows, they share the main loop it watches.
+        _root.watchdog = StallWatchdog.from_env(_root)
+    return _root
+
+def _close_root():
+    """Called when the last window is closed: ends mainloop()"""
+    global _root
+    root, _root = _root, None
+    if root is None: # already closing
+        return
+    if root.watchdog is not None:
+        root.watchdog.stop()
+        print(root.watchdog.report())
+    root.destroy()
 
 #%% Define Classes
-class ChatWindow(tk.Tk):
+class ChatWindow(tk.Toplevel):
     """
     Custom class that builds a GUI interface for Ollama and other self hosted LLMs.
+    
+    Every window is a Toplevel of one hidden Tk root, so File->New doesn't
+    start another Tcl interpreter and all windows run in the same mainloop().
+    The program ends when the last window is closed.
     """
+    num_ctx = 4096 # context window in tokens, see Options->Context
+    max_parallel = 1 # requests the server runs at once, see Options->Parallel Requests
+    windows = [] # the open windows
+    
     def __init__(self):
-        super().__init__()
+        super().__init__(_app_root())
+        ChatWindow.windows.append(self)
+        self.watchdog = self.master.watchdog
+        # the X button must go through destroy(), Tk's default skips it and the hidden root would stay
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+        
+        # How earlier messages are remembered (Options->Context):
+        # "none" = every prompt stands alone
+        # "chat" = resend the conversation's messages with each prompt
+        # "server" = reuse the model state the server returned for the last prompt
+        self.context_mode = tk.StringVar(self, value="server")
+        
+        # Options->Deterministic Answers: temperature 0 and a fixed seed, so
+        # the same prompt always gets the same answer (and can be cached)
+        self.deterministic = tk.BooleanVar(self, value=False)
+        # Options->Response Cache: answer repeated deterministic prompts from the cache
+        self.use_cache = tk.BooleanVar(self, value=True)
+        self.bypass_cache_once = False # set by "Skip Cache for Next Prompt"
         
         # Initialize filename with current date and time
         current_datetime = datetime.datetime.now()
@@ -19,24 +79,58 @@ class ChatWindow(tk.Tk):
         
         self.geometry("400x300")
         
+        # The messages of this chat, see utils/conversation.py. Saving, the
+        # context sent to the model and the transcript below all come from it.
+        self.conversation = Conversation()
+        self.conversation.add("text", 'Hello World!\n\n')
+        self.search_index = SearchIndex(self.conversation) # for Edit->Find, see _index_conversation
+        self._index_after_id = None
+        
         # 1. Create a label widget for the chat window
-        self.chat_history = scrolledtext.ScrolledText(self, wrap="word", width=40, height=10)
-        self.chat_history.insert(tk.INSERT, 'Hello World!\n\n')
+        # (read-only, only the part near the viewport is in the Tk buffer, see gui/transcript.py)
+        self.chat_history = TranscriptView(self, self.conversation, wrap="word", width=40, height=10)
         self.chat_history.pack(side="top", fill='both', expand=True, padx=5, pady=5)
         
+        # 1b. Create a status bar under the chat window (model state, etc.)
+        self.status_bar = tk.Label(self, text="", anchor="w", relief=tk.SUNKEN, bd=1)
+        self.status_bar.pack(side="top", fill='x', padx=5)
+        
         # 2. Create a button to send the message
         self.send_button = tk.Button(self, text="Send")
         self.send_button.pack(side='right', padx=5, pady=5)
         # Add the command to the button
-        self.send_button["command"] = self.send_prompt
+        self.send_button["command"] = self._timed(self.send_prompt)
+        
+        # 2b. Create a button to stop the response being generated (Esc)
+        self.stop_button = tk.Button(self, text="Stop", state=tk.DISABLED, command=self._timed(self.stop_prompt))
+        self.stop_button.pack(side='right', pady=5)
+        self.bind("<Escape>", self._timed(lambda event: self.stop_prompt(), "stop_prompt (Esc)"))
         
         # 3. Create an entry widget for the user to input their message
         self.user_prompt = tk.Text(self, height=5)
         self.user_prompt.pack(side='left', fill='x', expand=True, padx=5, pady=5)
         
+        # 4. The find bar (Ctrl+F) is built the first time it is opened, see open_find
+        self.find_bar = None
+        self.bind("<Control-f>", self._timed(lambda event: self.open_find(), "open_find (Ctrl+F)"))
+        self.bind("<Control-n>", self._timed(lambda event: self.new_window(), "new_window (Ctrl+N)"))
+        
         # Create the menu bar
         self.create_menu()
 
+    def _timed(self, func, name=None):
+        """Callback wrapped for the stall watchdog, or unchanged if it is off"""
+        if self.watchdog is None:
+            return func
+        return self.watchdog.timed(func, name)
+    
+    def destroy(self):
+        if self in ChatWindow.windows:
+            ChatWindow.windows.remove(self)
+        super().destroy()
+        if not ChatWindow.windows:
+            _close_root()
+    
     # Placeholder function for new features
     @staticmethod
     def do_nothing():
@@ -49,30 +143,46 @@ class ChatWindow(tk.Tk):
         menu_bar = tk.Menu(self)
         
         # Creating the File menu
-        file_menu = tk.Menu(menu_bar, tearoff=0)
-        file_menu.add_command(label="New", command=self.new_window)
-        file_menu.add_command(label="Open", command=self.open_file)
-        file_menu.add_command(label="Save", command=self.save_file)
-        file_menu.add_command(label="Save As", command=self.save_as)
+        file_menu = self.file_menu = tk.Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label="New", accelerator="Ctrl+N", command=self._timed(self.new_window))
+        file_menu.add_command(label="Open", command=self._timed(self.open_file))
+        file_menu.add_command(label="Save", command=self._timed(self.save_file))
+        file_menu.add_command(label="Save As", command=self._timed(self.save_as))
         file_menu.add_separator()
         #file_menu.add_command(label="Exit", command=self.destroy) # Default behavior
-        file_menu.add_command(label="Exit", command=self.exit)
+        file_menu.add_command(label="Exit", command=self._timed(self.exit))
         # Uncomment to redirect the "X" button from self.destroy to self.exit
         #self.protocol("WM_DELETE_WINDOW", self.exit)
         menu_bar.add_cascade(label="File", menu=file_menu)
         
         # Creating the Edit menu
         edit_menu = tk.Menu(menu_bar, tearoff=0)
-        edit_menu.add_command(label="Undo (TBD)", command=self.do_nothing)
+        edit_menu.add_command(label="Undo (TBD)", command=self._timed(self.do_nothing))
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Cut (TBD)", command=self._timed(self.do_nothing))
+        edit_menu.add_command(label="Copy (TBD)", command=self._timed(self.do_nothing))
+        edit_menu.add_command(label="Paste (TBD)", command=self._timed(self.do_nothing))
         edit_menu.add_separator()
-        edit_menu.add_command(label="Cut (TBD)", command=self.do_nothing)
-        edit_menu.add_command(label="Copy (TBD)", command=self.do_nothing)
-        edit_menu.add_command(label="Paste (TBD)", command=self.do_nothing)
+        edit_menu.add_command(label="Find...", accelerator="Ctrl+F", command=self._timed(self.open_find))
         menu_bar.add_cascade(label="Edit", menu=edit_menu)
         
         # Creating the Options menu
         options_menu = tk.Menu(menu_bar, tearoff=0)
-        options_menu.add_command(label="Context", command=self.do_nothing)
+        context_menu = tk.Menu(options_menu, tearoff=0)
+        context_menu.add_radiobutton(label="Single Prompt", variable=self.context_mode, value="none", command=self._timed(self.context_changed))
+        context_menu.add_radiobutton(label="Remember Conversation (Chat History)", variable=self.context_mode, value="chat", command=self._timed(self.context_changed))
+        context_menu.add_radiobutton(label="Remember Conversation (Server Context)", variable=self.context_mode, value="server", command=self._timed(self.context_changed))
+        context_menu.add_separator()
+        context_menu.add_command(label="Context Size...", command=self._timed(self.set_context_size))
+        options_menu.add_cascade(label="Context", menu=context_menu)
+        options_menu.add_checkbutton(label="Deterministic Answers (temperature 0)", variable=self.deterministic)
+        cache_menu = tk.Menu(options_menu, tearoff=0)
+        cache_menu.add_checkbutton(label="Use Cached Answers", variable=self.use_cache)
+        cache_menu.add_command(label="Skip Cache for Next Prompt", command=self._timed(self.skip_cache_once))
+        cache_menu.add_separator()
+        cache_menu.add_command(label="Clear Cache", command=self._timed(self.clear_cache))
+        options_menu.add_cascade(label="Response Cache", menu=cache_menu)
+        options_menu.add_command(label="Parallel Requests...", command=self._timed(self.set_max_parallel))
         menu_bar.add_cascade(label="Options", menu=options_menu)
         
         # Adding the menu bar to the window
@@ -89,17 +199,168 @@ class ChatWindow(tk.Tk):
         """Get the user's message and add it to the chat history"""
         user_message = self.user_prompt.get("1.0", tk.END).strip()
         if user_message:
-            self.chat_history.insert(tk.END, f"You: {user_message}\n\n")
+            self.add_message("user", user_message)
+            self.chat_history.see_end()
             self.user_prompt.delete("1.0", tk.END)  # Clear the input field
     
+    def stop_prompt(self):
+        """Stop the response being generated - to be overridden by subclasses"""
+        pass
+    
+    def add_message(self, role, content="", finished=True, **kwargs):
+        """Add a message to the conversation and show it, see Conversation.add"""
+        message = self.conversation.add(role, content, finished, **kwargs)
+        self.chat_history.extend(message.render(), new_message=True)
+        self._schedule_indexing()
+        return message
+    
+    def extend_message(self, message, text):
+        """Append text (e.g. a streamed token) to `message`, one added with finished=False"""
+        message.append(text)
+        self._show_message_change(message, text)
+    
+    def finish_message(self, message, tokens=None, stopped=False):
+        """Mark `message` complete, see Message.finish"""
+        self._show_message_change(message, message.finish(tokens, stopped))
+        self._schedule_indexing()
+    
+    def _show_message_change(self, message, text):
+        # not necessarily the last message (a notice may have come in meanwhile)
+        index = self.conversation.index(message)
+        if index is not None: # else the conversation has been replaced since
+            self.chat_history.extend(text, index=index) # shown with the next frame, see TranscriptView
+    
+    def set_status(self, text):
+        """Show a short message in the status bar"""
+        self.status_bar.config(text=text)
+    
+    #%% Find
+    def _schedule_indexing(self):
+        """Update the find index soon, see _index_conversation"""
+        if self._index_after_id is None:
+            self._index_after_id = self.after_idle(self._index_conversation)
+    
+    def _index_conversation(self):
+        """Index the new messages for Edit->Find, a chunk per turn of the event loop (an opened file can be long)"""
+        self._index_after_id = None
+        if self.search_index.conversation is not self.conversation: # another file was opened
+            self.search_index = SearchIndex(self.conversation)
+        if not self.search_index.update(max_lines=2000):
+            self._index_after_id = self.after(1, self._index_conversation)
+    
+    def open_find(self):
+        """Show the find bar (Edit->Find, Ctrl+F) and search for what is in it"""
+        if self.find_bar is None:
+            self.find_bar = tk.Frame(self)
+            self.find_entry = tk.Entry(self.find_bar)
+            self.find_count = tk.Label(self.find_bar, text="", width=12, anchor="e")
+            self.find_entry.pack(side="left", fill="x", expand=True)
+            self.find_count.pack(side="left", padx=5)
+            for text, command in (("\u25b2", self.find_previous), ("\u25bc", self.find_next), ("\u2715", self.close_find)):
+                tk.Button(self.find_bar, text=text, command=self._timed(command)).pack(side="left")
+            self.find_entry.bind("<KeyRelease>", self._on_find_typed)
+            self.find_entry.bind("<Return>", self._timed(lambda event: self.find_next()))
+            self.find_entry.bind("<Shift-Return>", self._timed(lambda event: self.find_previous()))
+            self.find_entry.bind("<Escape>", lambda event: self.close_find() or "break") # not Stop
+            self.find_hits = []
+            self.find_current = -1
+            self._find_after_id = None
+        if not self.find_bar.winfo_ismapped():
+            self.find_bar.pack(side="top", fill="x", padx=5, before=self.chat_history)
+        self.find_entry.focus_set()
+        self.find_entry.select_range(0, tk.END)
+        self.find()
+    
+    def close_find(self):
+        """Hide the find bar and its highlights"""
+        if self.find_bar is not None:
+            self.find_bar.pack_forget()
+            self.chat_history.show_hits([])
+            self.user_prompt.focus_set()
+    
+    def _on_find_typed(self, event):
+        if event.keysym in ("Return", "Escape", "Shift_L", "Shift_R"):
+            return
+        if self._find_after_id is not None: # search once the user pauses
+            self.after_cancel(self._find_after_id)
+        self._find_after_id = self.after(150, self._timed(self.find))
+    
+    def find(self):
+        """Highlight every hit of the find bar's text and go to the first one after the view"""
+        self._find_after_id = None
+        if self.search_index.conversation is not self.conversation: # another file was opened, not indexed yet
+            self._index_conversation()
+        self.find_hits = self.search_index.find(self.find_entry.get())
+        self.chat_history.show_hits(self.find_hits)
+        self.find_current = -1
+        top = self.chat_history.top_message()
+        self.find_next(start=next((number for number, hit in enumerate(self.find_hits) if hit[0] >= top), 0))
+    
+    def find_next(self, start=None):
+        """Go to the next hit (Enter in the find bar)"""
+        if start is None:
+            start = self.find_current + 1
+        self._show_find_hit(start)
+    
+    def find_previous(self):
+        """Go to the previous hit (Shift+Enter in the find bar)"""
+        self._show_find_hit(self.find_current - 1)
+    
+    def _show_find_hit(self, number):
+        if not self.find_hits:
+            self.find_count.config(text="No matches" if self.find_entry.get() else "")
+            return
+        self.find_current = number % len(self.find_hits)
+        self.chat_history.show_hit(*self.find_hits[self.find_current])
+        self.find_count.config(text=f"{self.find_current + 1} of {len(self.find_hits)}")
+    
+    def set_context_size(self):
+        """Ask the user for the context window size (num_ctx) in tokens"""
+        from tkinter import simpledialog
+        num_ctx = simpledialog.askinteger(
+            "Context Size", "Context window (tokens):",
+            initialvalue=self.num_ctx, minvalue=256, maxvalue=1048576, parent=self
+        )
+        if num_ctx:
+            self.num_ctx = num_ctx
+            self.context_changed()
+    
+    def skip_cache_once(self):
+        """Send the next prompt to the model even if a cached answer exists"""
+        self.bypass_cache_once = True
+        self.set_status("Next prompt will skip the cache")
+    
+    def clear_cache(self):
+        """Called by Options->Response Cache->Clear Cache - to be overridden by subclasses"""
+        pass
+    
+    def set_max_parallel(self):
+        """Ask the user how many requests may run on the server at once"""
+        from tkinter import simpledialog
+        max_parallel = simpledialog.askinteger(
+            "Parallel Requests", "Requests the server runs at once\n(match OLLAMA_NUM_PARALLEL):",
+            initialvalue=self.max_parallel, minvalue=1, maxvalue=64, parent=self
+        )
+        if max_parallel:
+            self.max_parallel = max_parallel
+    
+    def context_changed(self):
+        """Called when the context settings change - to be overridden by subclasses"""
+        pass
+    
+    def conversation_reset(self):
+        """Called when the transcript is replaced (e.g. a file is opened) - to be overridden by subclasses"""
+        pass
+    
     def new_window(self):
-        """Create a new chat window"""
-        new_chat = ChatWindow()
-        new_chat.mainloop()
+        """Open another chat window of the same kind, in this mainloop()"""
+        return type(self)()
     
     def open_file(self):
-        """Open a file and load its contents into chat_history"""
+        """Open a saved transcript (or any text file) as the conversation"""
+        from tkinter import filedialog, messagebox
         file_path = filedialog.askopenfilename(
+            parent=self,
             defaultextension=".md",
             filetypes=[("Markdown Files", "*.md"), ("Text Files", "*.txt"), ("All Files", "*.*")]
         )
@@ -111,32 +372,36 @@ class ChatWindow(tk.Tk):
             
             try:
                 with open(file_path, 'r', encoding='utf-8') as file:
-                    # Clear current chat history
-                    self.chat_history.delete("1.0", tk.END)
-                    
                     # Read file contents safely as plain text
                     file_content = file.read()
                     
-                    # Insert content into chat history
-                    self.chat_history.insert(tk.END, file_content)
+                    # Replace the conversation with it
+                    self.conversation = Conversation.from_markdown(file_content)
+                    self.chat_history.show(self.conversation, at_end=False)
+                
+                # Remember the opened conversation instead of the previous one
+                self.conversation_reset()
+                self._schedule_indexing()
             except Exception as e:
-                messagebox.showerror("Error", f"Could not open file: {str(e)}")
+                messagebox.showerror("Error", f"Could not open file: {str(e)}", parent=self)
     
     def save_file(self):
         """Save chat history to the current filename"""
+        from tkinter import messagebox
         # If filename is still the default with date/time, prompt for save as
         if self.filename.startswith("Untitled-"):
             self.save_as()
         else:
             try:
-                with open(self.filename, 'w', encoding='utf-8') as file:
-                    file.write(self.chat_history.get("1.0", tk.END))
+                self.conversation.save(self.filename)
             except Exception as e:
-                messagebox.showerror("Error", f"Could not save file: {str(e)}")
+                messagebox.showerror("Error", f"Could not save file: {str(e)}", parent=self)
     
     def save_as(self):
         """Prompt user for filename and save chat history"""
+        from tkinter import filedialog, messagebox
         file_path = filedialog.asksaveasfilename(
+            parent=self,
             initialfile=self.filename,
             defaultextension=".md",
             filetypes=[("Markdown Files", "*.md"), ("Text Files", "*.txt"), ("All Files", "*.*")]
@@ -148,10 +413,9 @@ class ChatWindow(tk.Tk):
             self.title(os.path.basename(self.filename))
             
             try:
-                with open(file_path, 'w', encoding='utf-8') as file:
-                    file.write(self.chat_history.get("1.0", tk.END))
+                self.conversation.save(file_path)
             except Exception as e:
-                messagebox.showerror("Error", f"Could not save file: {str(e)}")
+                messagebox.showerror("Error", f"Could not save file: {str(e)}", parent=self)
 
 
 #%% Start Program for standalone testing
@@ -0,0 +1,192 @@
+# src/gui/highlight.py
+'''
+Syntax highlighting for the code blocks in the transcript.
+
+A small regex lexer per language family, no third party packages. Lexing is
+line by line and the state carried to the next line is tiny (None, or the
+delimiter that closes a string or comment spanning lines), so markdown_tags.py
+keeps it with its per-line checkpoint: a streamed answer only re-lexes its
+last line. Finished code blocks (closing fence seen) are cached by content in
+`block_cache`, paging through or reopening a long transcript does not lex the
+same code twice.
+'''
+
+import collections
+import hashlib
+import re
+
+# tag, as configured by MarkdownTagger, of each token kind
+KEYWORD, STRING, COMMENT, NUMBER, DEFINITION = "hl_keyword", "hl_string", "hl_comment", "hl_number", "hl_def"
+
+_C_FAMILY = ("break case catch class const continue default do else enum extern for goto if import new return "
+             "static struct switch this throw try typedef union void while true false null")
+_LANGUAGES = {
+    # name: (keywords, line comment, block comment, multi-line string delimiters, case sensitive)
+    "python": ("False None True and as assert async await break class continue def del elif else except "
+               "finally for from global if import in is lambda match case nonlocal not or pass raise return "
+               "self try while with yield", "#", None, ('"""', "'''"), True),
+    "javascript": (_C_FAMILY + " async await const debugger delete export extends finally function in "
+                   "instanceof let of super typeof undefined var yield interface type implements",
+                   "//", ("/*", "*/"), ("`",), True),
+    "c": (_C_FAMILY + " auto bool char double float inline int long register short signed sizeof unsigned "
+          "volatile NULL nullptr namespace using template typename public private protected virtual "
+          "delete override", "//", ("/*", "*/"), (), True),
+    "java": (_C_FAMILY + " abstract boolean byte char double extends final finally float implements "
+             "instanceof int interface long native package private protected public short super "
+             "synchronized throws transient var val fun object", "//", ("/*", "*/"), ('"""',), True),
+    "go": ("break case chan const continue default defer else fallthrough for func go goto if import "
+           "interface map package range return select struct switch type var nil true false",
+           "//", ("/*", "*/"), ("`",), True),
+    "rust": ("as async await break const continue crate dyn else enum extern false fn for if impl in let "
+             "loop match mod move mut pub ref return self Self static struct super trait true type unsafe "
+             "use where while", "//", ("/*", "*/"), (), True),
+    "bash": ("if then else elif fi case esac for while until do done in function return local export "
+             "readonly echo exit set unset source", "#", None, (), True),
+    "sql": ("select from where insert into values update set delete create table view index drop alter "
+            "join left right inner outer full on group by order having limit offset and or not null is "
+            "as distinct union all primary key foreign references default case when then else end",
+            "--", ("/*", "*/"), (), False),
+    "": ("", None, None, (), True), # unknown language: strings and numbers only
+}
+_ALIASES = {
+    "py": "python", "python3": "python", "py3": "python", "ipython": "python",
+    "js": "javascript", "jsx": "javascript", "ts": "javascript", "tsx": "javascript",
+    "typescript": "javascript", "node": "javascript", "json": "javascript",
+    "cpp": "c", "c++": "c", "cc": "c", "h": "c", "hpp": "c", "cs": "c", "csharp": "c", "c#": "c",
+    "objc": "c", "kotlin": "java", "kt": "java", "scala": "java",
+    "golang": "go", "rs": "rust",
+    "sh": "bash", "shell": "bash", "zsh": "bash", "console": "bash", "powershell": "bash", "ps1": "bash",
+    "postgres": "sql", "mysql": "sql", "sqlite": "sql",
+}
+# the name after these keywords is highlighted as a definition
+_DEFINERS = {"def", "class", "function", "fn", "func", "struct", "interface", "enum", "trait", "type"}
+
+
+class Lexer:
+    """
+    Line lexer for one language. lex(line, state) -> (spans, state), spans
+    being (tag, start, end) columns and state None or (tag, closing delimiter).
+    """
+    def __init__(self, keywords, line_comment, block_comment, multiline, case_sensitive):
+        self.case_sensitive = case_sensitive
+        self.keywords = set(keywords.split() if case_sensitive else keywords.lower().split())
+        self.block_comment = block_comment
+        parts = []
+        if block_comment:
+            parts.append(f"(?P<block>{re.escape(block_comment[0])})")
+        if line_comment:
+            parts.append(f"(?P<comment>{re.escape(line_comment)}.*)")
+        if multiline:
+            parts.append("(?P<multi>" + "|".join(re.escape(d) for d in multiline) + ")")
+        parts += [r'(?P<string>"(?:\\.|[^"\\])*"?|\'(?:\\.|[^\'\\])*\'?)',
+                  r"(?P<number>\b(?:0[xX][0-9a-fA-F_]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)\b)",
+                  r"(?P<word>[A-Za-z_]\w*)"]
+        self.pattern = re.compile("|".join(parts))
+
+    @staticmethod
+    def _close(line, start, delimiter, escapes):
+        '''Index just after `delimiter` in line[start:], -1 if it is not there.'''
+        if not escapes:
+            end = line.find(delimiter, start)
+            return -1 if end < 0 else end + len(delimiter)
+        position = start
+        while position < len(line):
+            if line[position] == "\\":
+                position += 2
+            elif line.startswith(delimiter, position):
+                return position + len(delimiter)
+            else:
+                position += 1
+        return -1
+
+    def lex(self, line, state=None):
+        spans = []
+        position = 0
+        if state is not None: # inside a string or comment from an earlier line
+            tag, delimiter = state
+            end = self._close(line, 0, delimiter, tag == STRING)
+            if end < 0:
+                return [(tag, 0, len(line))], state
+            spans.append((tag, 0, end))
+            position = end
+        define = False # the previous word was "def", "class"...
+        while True:
+            match = self.pattern.search(line, position)
+            if match is None:
+                return spans, None
+            kind, start = match.lastgroup, match.start()
+            position = match.end()
+            if kind in ("block", "multi"):
+                tag = COMMENT if kind == "block" else STRING
+                delimiter = self.block_comment[1] if kind == "block" else match.group()
+                end = self._close(line, position, delimiter, tag == STRING)
+                if end < 0: # continues on the next line
+                    spans.append((tag, start, len(line)))
+                    return spans, (tag, delimiter)
+                spans.append((tag, start, end))
+                position = end
+            elif kind == "comment":
+                spans.append((COMMENT, start, position))
+            elif kind == "string":
+                spans.append((STRING, start, position))
+            elif kind == "number":
+                spans.append((NUMBER, start, position))
+            else:
+                word = match.group() if self.case_sensitive else match.group().lower()
+                if define:
+                    spans.append((DEFINITION, start, position))
+                elif word in self.keywords:
+                    spans.append((KEYWORD, start, position))
+                define = word in _DEFINERS and word in self.keywords
+
+
+_lexers = {}
+
+
+def lexer_for(language):
+    '''The Lexer for a code fence's language name, a generic one if it is unknown.'''
+    name = language.lower()
+    name = _ALIASES.get(name, name)
+    if name not in _LANGUAGES:
+        name = ""
+    if name not in _lexers:
+        _lexers[name] = Lexer(*_LANGUAGES[name])
+    return _lexers[name]
+
+
+class HighlightCache:
+    """
+    Spans of finished code blocks, keyed by language and content. LRU.
+
+    Parameters
+    ----------
+    max_blocks : int, optional
+    """
+    def __init__(self, max_blocks=512):
+        self.max_blocks = max_blocks
+        self._blocks = collections.OrderedDict() # key -> list of spans per line
+        self.hits = self.misses = 0
+
+    def spans(self, language, lines):
+        '''Spans of every line of a code block (without its fences).'''
+        key = (language, hashlib.blake2b("\n".join(lines).encode("utf-8", "replace"), digest_size=16).digest())
+        cached = self._blocks.get(key)
+        if cached is not None:
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        lexer = lexer_for(language)
+        state = None
+        result = []
+        for line in lines:
+            spans, state = lexer.lex(line, state)
+            result.append(spans)
+        self._blocks[key] = result
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return result
+
+
+# shared by every transcript
+block_cache = HighlightCache()
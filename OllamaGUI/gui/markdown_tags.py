@@ -0,0 +1,170 @@
+# src/gui/markdown_tags.py
+'''
+Markdown in the transcript, shown with Tk text tags.
+
+The text itself is not changed (the transcript is saved as Markdown), the
+markup characters are only dimmed. Parsing is line by line: the only thing
+carried from one line to the next is whether it is inside a ``` code fence
+(and the code's lexer state, see highlight.py), so a streamed answer is
+rendered by re-parsing just its last, incomplete line plus whatever arrived
+since. See MarkdownTagger.render.
+'''
+
+import re
+import tkinter as tk
+import tkinter.font as tkfont
+
+try:
+    from . import highlight
+except ImportError: # chat_window.py run on its own
+    import highlight
+
+_FENCE = re.compile(r"\s*(```|~~~)\s*([\w+#.-]*)")
+_HEADING = re.compile(r"(#{1,6})\s+")
+_LIST_ITEM = re.compile(r"\s*([-*+]|\d+[.)])\s+")
+_QUOTE = re.compile(r"\s*>")
+_RULE = re.compile(r"\s*([-*_])(\s*\1){2,}\s*$")
+# first match wins, so nothing is bold inside `code`
+_INLINE = re.compile(
+    r"(?P<code>`+)(?P<code_text>.+?)(?P=code)"
+    r"|(?P<bold>\*\*|__)(?P<bold_text>\S(?:.*?\S)?)(?P=bold)"
+    r"|(?<![\w*])\*(?P<italic_text>[^*\s](?:[^*]*?[^*\s])?)\*(?!\*)"
+    r"|(?<!\w)_(?P<italic_text2>[^_\s](?:[^_]*?[^_\s])?)_(?!\w)"
+    r"|\[(?P<link_text>[^\]]+)\]\((?P<url>[^)\s]+)\)"
+)
+
+
+def parse_line(line, fence=None):
+    '''
+    Tags of one line. `fence` is None outside a code fence, else the fence's
+    language ("" if none was given) and the lexer state at the start of the line.
+
+    Returns (spans, fence after this line), spans being (tag, start, end) columns.
+    '''
+    match = _FENCE.match(line)
+    if fence is not None: # inside a code block, only its end is special
+        if match and not match.group(2):
+            return [("md_fence", 0, len(line))], None
+        language, state = fence
+        spans, state = highlight.lexer_for(language).lex(line, state)
+        return [("md_code_block", 0, len(line))] + spans, (language, state)
+    if match:
+        return [("md_fence", 0, len(line))], (match.group(2), None)
+
+    spans = []
+    start = 0
+    heading = _HEADING.match(line)
+    if heading:
+        spans.append(("md_syntax", 0, heading.end()))
+        spans.append((f"md_h{min(len(heading.group(1)), 3)}", heading.end(), len(line)))
+        start = heading.end()
+    elif _RULE.match(line):
+        return [("md_syntax", 0, len(line))], None
+    elif _QUOTE.match(line):
+        spans.append(("md_quote", 0, len(line)))
+    else:
+        item = _LIST_ITEM.match(line)
+        if item:
+            spans.append(("md_bullet", item.start(1), item.end(1)))
+            start = item.end()
+
+    for m in _INLINE.finditer(line, start):
+        if m.group("code"):
+            ticks = len(m.group("code"))
+            spans += [("md_syntax", m.start(), m.start() + ticks), ("md_code", m.start() + ticks, m.end() - ticks),
+                      ("md_syntax", m.end() - ticks, m.end())]
+        elif m.group("bold"):
+            spans += [("md_syntax", m.start(), m.start() + 2), ("md_bold", m.start() + 2, m.end() - 2),
+                      ("md_syntax", m.end() - 2, m.end())]
+        elif m.group("link_text"):
+            text_end = m.start("link_text") + len(m.group("link_text"))
+            spans += [("md_syntax", m.start(), m.start() + 1), ("md_link", m.start() + 1, text_end),
+                      ("md_syntax", text_end, m.end())]
+        else: # italic
+            spans += [("md_syntax", m.start(), m.start() + 1), ("md_italic", m.start() + 1, m.end() - 1),
+                      ("md_syntax", m.end() - 1, m.end())]
+    return spans, None
+
+
+class MarkdownTagger:
+    """
+    Applies parse_line() tags to a range of a tk.Text.
+
+    Parameters
+    ----------
+    text : tk.Text
+    """
+    TAGS = ("md_h1", "md_h2", "md_h3", "md_bold", "md_italic", "md_code", "md_code_block",
+            "md_fence", "md_quote", "md_bullet", "md_link", "md_syntax",
+            highlight.KEYWORD, highlight.STRING, highlight.COMMENT, highlight.NUMBER, highlight.DEFINITION)
+
+    def __init__(self, text):
+        self.text = text
+        try:
+            base = tkfont.nametofont(text.cget("font"))
+        except tk.TclError: # not a named font
+            base = tkfont.Font(font=text.cget("font"))
+        size = base.cget("size") # negative means pixels, scale it the same way
+        self.fonts = {} # keep references, Tk forgets fonts Python no longer holds
+        for name, scale, weight, slant in (("md_h1", 1.5, "bold", "roman"), ("md_h2", 1.3, "bold", "roman"),
+                                           ("md_h3", 1.1, "bold", "roman"), ("md_bold", 1, "bold", "roman"),
+                                           ("md_italic", 1, "normal", "italic")):
+            font = base.copy()
+            font.configure(size=round(size * scale), weight=weight, slant=slant)
+            self.fonts[name] = font
+            text.tag_configure(name, font=font)
+        text.tag_configure("md_code", font="TkFixedFont", background="#eeeeee")
+        text.tag_configure("md_code_block", font="TkFixedFont", background="#f4f4f4")
+        text.tag_configure("md_fence", font="TkFixedFont", background="#f4f4f4", foreground="#888888")
+        text.tag_configure("md_quote", foreground="#555555", lmargin1=12, lmargin2=12)
+        text.tag_configure("md_bullet", foreground="#555555")
+        text.tag_configure("md_link", foreground="#1a5fb4", underline=True)
+        text.tag_configure("md_syntax", foreground="#999999")
+        # after md_code_block, so these colors win
+        text.tag_configure(highlight.KEYWORD, foreground="#8e3ab8")
+        text.tag_configure(highlight.STRING, foreground="#2e7d32")
+        text.tag_configure(highlight.COMMENT, foreground="#8a8a8a")
+        text.tag_configure(highlight.NUMBER, foreground="#b35900")
+        text.tag_configure(highlight.DEFINITION, foreground="#1a5fb4")
+
+    def render(self, start, end="end-1c", fence=None):
+        '''
+        (Re)tag the text from `start` to `end`, `fence` being the state at
+        `start` (see parse_line). Returns the state at the start of the
+        last line, from where the next render() of a growing text continues.
+        
+        Code blocks that end within the range are highlighted through
+        highlight.block_cache, the others line by line.
+        '''
+        line0, column0 = (int(part) for part in self.text.index(start).split("."))
+        for tag in self.TAGS:
+            self.text.tag_remove(tag, start, end)
+        lines = self.text.get(start, end).split("\n")
+        number = 0
+        while number < len(lines):
+            last_state = fence
+            opened = fence is None
+            spans, fence = parse_line(lines[number], fence)
+            self._tag(line0 + number, column0 if number == 0 else 0, spans)
+            number += 1
+            if opened and fence is not None: # a code block starts, is it complete?
+                close = self._closing_fence(lines, number)
+                if close is not None and close < len(lines) - 1: # the closing fence is not the last, growing line
+                    for spans in highlight.block_cache.spans(fence[0], lines[number:close]):
+                        self._tag(line0 + number, 0, [("md_code_block", 0, len(lines[number]))] + spans)
+                        number += 1
+                    fence = (fence[0], None)
+        return last_state
+
+    @staticmethod
+    def _closing_fence(lines, start):
+        for number in range(start, len(lines)):
+            match = _FENCE.match(lines[number])
+            if match and not match.group(2):
+                return number
+        return None
+
+    def _tag(self, line, offset, spans):
+        for tag, first, last in spans:
+            if last > first:
+                self.text.tag_add(tag, f"{line}.{first + offset}", f"{line}.{last + offset}")
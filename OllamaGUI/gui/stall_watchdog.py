@@ -0,0 +1,154 @@
+# src/gui/stall_watchdog.py
+'''
+Finds out what freezes the window.
+
+Opt-in: set OLLAMAGUI_WATCHDOG=1 (or to a threshold in milliseconds) before
+starting the app. Then:
+
+- a heartbeat scheduled with after() measures how late the Tk main loop runs
+  it; lateness means something blocked the loop,
+- while the loop is blocked, a background thread takes a sample of the main
+  thread's stack, which shows the code responsible,
+- menu commands and button callbacks wrapped with timed() are timed, the
+  slow ones are reported by name.
+
+Reports go to stderr and to ui-stalls.log in the user cache directory. A
+summary of the callback timings is printed when the window closes.
+'''
+
+import os
+import sys
+import threading
+import time
+import traceback
+
+
+class StallWatchdog:
+    """
+    Main loop lag monitor and callback profiler for one Tk window.
+
+    Must be created on the Tk thread.
+
+    Parameters
+    ----------
+    widget : tk.Misc
+        Any widget, used for its `after()` method.
+    threshold_ms : float, optional
+        Lag or callback duration worth reporting.
+    interval_ms : int, optional
+        Heartbeat period.
+    log_path : str, optional
+        File the reports are appended to, besides stderr.
+    """
+    def __init__(self, widget, threshold_ms=200, interval_ms=50, log_path=None):
+        self.widget = widget
+        self.threshold = threshold_ms / 1000
+        self.interval_ms = interval_ms
+        self.log_path = log_path
+        self.stats = {} # callback name -> [calls, total seconds, max seconds]
+        self.max_lag = 0.0
+        self._main_thread = threading.get_ident()
+        self._current = None # name of the timed callback running right now
+        self._last_beat = time.perf_counter()
+        self._sampled = False # one stack sample per stall
+        self._after_id = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, widget):
+        '''A started watchdog if OLLAMAGUI_WATCHDOG is set, else None.'''
+        value = os.environ.get("OLLAMAGUI_WATCHDOG", "")
+        if value.lower() in ("", "0", "false", "no"):
+            return None
+        try:
+            threshold_ms = float(value)
+        except ValueError:
+            threshold_ms = 200
+        if threshold_ms <= 1: # OLLAMAGUI_WATCHDOG=1 means "on"
+            threshold_ms = 200
+        try: # next to the response cache, if the backend is around
+            from utils.response_cache import default_cache_path
+            log_path = os.path.join(os.path.dirname(default_cache_path()), "ui-stalls.log")
+        except ImportError: # chat_window.py tested alone
+            log_path = None
+        return cls(widget, threshold_ms, log_path=log_path).start()
+
+    def start(self):
+        self._log(f'Stall watchdog on, reporting anything over {self.threshold * 1000:.0f} ms')
+        self._last_beat = time.perf_counter()
+        self._after_id = self.widget.after(self.interval_ms, self._heartbeat)
+        threading.Thread(target=self._sample_loop, name="ollamagui-watchdog", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except Exception: # window already gone
+                pass
+            self._after_id = None
+
+    def timed(self, func, name=None):
+        '''Wrap a Tk callback so its duration is recorded and slow calls are reported.'''
+        name = name or getattr(func, "__qualname__", repr(func))
+
+        def wrapper(*args, **kwargs):
+            outer, self._current = self._current, name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._current = outer
+                calls, total, longest = self.stats.get(name, (0, 0.0, 0.0))
+                self.stats[name] = [calls + 1, total + elapsed, max(longest, elapsed)]
+                if elapsed > self.threshold:
+                    self._log(f'Slow callback {name}: {elapsed * 1000:.0f} ms')
+        return wrapper
+
+    def report(self):
+        '''Callback timings, slowest first.'''
+        lines = [f'Worst main loop lag: {self.max_lag * 1000:.0f} ms',
+                 f'{"callback":40} {"calls":>6} {"mean ms":>8} {"max ms":>8}']
+        for name, (calls, total, longest) in sorted(self.stats.items(), key=lambda item: -item[1][2]):
+            lines.append(f'{name:40} {calls:>6} {total / calls * 1000:>8.1f} {longest * 1000:>8.1f}')
+        return "\n".join(lines)
+
+    #%% Internals
+    def _heartbeat(self):
+        now = time.perf_counter()
+        lag = now - self._last_beat - self.interval_ms / 1000
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.threshold:
+            self._log(f'Main loop was blocked for {lag * 1000:.0f} ms')
+        self._last_beat = now
+        self._sampled = False
+        if not self._stop.is_set():
+            self._after_id = self.widget.after(self.interval_ms, self._heartbeat)
+
+    def _sample_loop(self):
+        '''Background thread: grab the main thread's stack while the loop is blocked.'''
+        while not self._stop.wait(self.threshold / 2):
+            blocked = time.perf_counter() - self._last_beat - self.interval_ms / 1000
+            if blocked <= self.threshold or self._sampled:
+                continue
+            self._sampled = True
+            frame = sys._current_frames().get(self._main_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self._log(f'Main loop blocked for {blocked * 1000:.0f} ms so far'
+                      f' (in {self._current or "an untimed callback"}), main thread stack:\n{stack}')
+
+    def _log(self, text):
+        line = f'[watchdog {time.strftime("%H:%M:%S")}] {text}'
+        print(line, file=sys.stderr)
+        if self.log_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+        except OSError:
+            pass
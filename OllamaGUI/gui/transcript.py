@@ -0,0 +1,381 @@
+# src/gui/transcript.py
+'''
+Virtualized transcript view.
+
+A Tk text widget gets slow once it holds a few MB: every insert, scroll and
+yview(END) has to deal with the whole buffer. TranscriptView shows a
+Conversation (utils/conversation.py) and only puts the messages around the
+viewport in the text widget. Scrolling near either end of what is loaded
+pages the neighbouring messages in and the far ones out. The scroll bar is
+driven by line counts of the whole conversation, so it looks like an
+ordinary scrolled text.
+
+Markdown is shown with text tags (gui/markdown_tags.py), rendered per message
+as it is loaded and, while an answer streams in, from the start of its last
+line only. Search hits (utils/search.py) are kept per message and tagged the
+same way, when their message is loaded.
+
+The widget is read-only for the user. The conversation is changed first, then
+the view is told with extend(). Streamed text is not inserted piece by piece:
+it is collected and flushed at most max_fps times a second, with one insert
+and one state toggle per frame, so a fast model costs no more redraws than a
+slow one. The view follows new text only if the user was at the bottom.
+'''
+
+import itertools
+import tkinter as tk
+
+try:
+    from .markdown_tags import MarkdownTagger
+except ImportError: # chat_window.py run on its own
+    from markdown_tags import MarkdownTagger
+
+
+class TranscriptView(tk.Frame):
+    """
+    Read-only scrolled text holding only the part of a conversation near the viewport.
+
+    Parameters
+    ----------
+    master : tk.Misc
+    conversation : Conversation
+    window_lines : int, optional
+        About how many lines are kept in the text widget.
+    max_fps : int, optional
+        How often streamed text is inserted, at most.
+    **options
+        Passed to the tk.Text (wrap, width, height...).
+    """
+    def __init__(self, master, conversation, window_lines=1500, max_fps=40, **options):
+        super().__init__(master)
+        self.window_lines = window_lines
+        self.flush_ms = max(1, 1000 // max_fps)
+        self.text = tk.Text(self, state=tk.DISABLED, **options)
+        self.scrollbar = tk.Scrollbar(self, command=self._on_scrollbar)
+        self.text.config(yscrollcommand=self._on_text_scrolled)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text.pack(side="left", fill="both", expand=True)
+        self.markdown = MarkdownTagger(self.text)
+        self._tail_fence = None # Markdown state at the "md_tail" mark, the start of the last line
+        self.text.tag_configure("search_hit", background="#fff59d") # after the Markdown tags, so it shows
+        self.text.tag_configure("search_current", background="#ffb74d")
+        self._hits = {} # message index -> [(start, end)] offsets in its render(), see show_hits
+
+        self.conversation = conversation
+        self.total_lines = conversation.lines
+        self.first = self.last = 0 # messages[first:last] are in the text widget
+        self._paging = False # a _page() is scheduled
+        self._pending = [] # streamed text waiting for the next frame
+        self._pending_index = None # the message it belongs to
+        self._stale = set() # loaded messages, other than the last, that changed since the last frame
+        self._flush_id = None
+        self._load_around(max(len(conversation) - 1, 0))
+
+    #%% Content
+    def show(self, conversation, at_end=True):
+        '''Show another conversation, from its end or its start.'''
+        self.conversation = conversation
+        self.total_lines = conversation.lines
+        self._hits = {}
+        self._load_around(max(len(conversation) - 1, 0) if at_end else 0)
+        if at_end:
+            self.text.yview(tk.END)
+
+    def extend(self, text, new_message=False, index=None):
+        '''
+        Message `index` (the last one by default) grew by `text`, or `text`
+        is the start of a message just added. Shown with the next frame if
+        the message is loaded, else when the user scrolls to it.
+        '''
+        self.total_lines += text.count("\n")
+        count = len(self.conversation)
+        if index is not None and index < count - 1 and not new_message: # no longer the last message
+            if self.first <= index < self.last: # re-rendered as a whole, rare enough
+                self._stale.add(index)
+                if self._flush_id is None:
+                    self._flush_id = self.after(self.flush_ms, self.flush)
+            return
+        if new_message:
+            self.flush() # the previous message's text goes before the new mark
+            if self.last == count - 1:
+                follow = self._following()
+                self._set_block_mark(count - 1, "end-1c")
+                self.last = count
+                self._set_tail(f"block{count - 1}", None)
+                self._insert_tail(text, follow)
+        elif self.last == count:
+            self._pending.append(text)
+            self._pending_index = count - 1
+            if self._flush_id is None:
+                self._flush_id = self.after(self.flush_ms, self.flush)
+
+    def flush(self):
+        '''Insert the text collected since the last frame, in one go.'''
+        if self._flush_id is not None:
+            self.after_cancel(self._flush_id)
+            self._flush_id = None
+        if not self.winfo_exists():
+            return
+        if self._pending and self.last == self._pending_index + 1: # its message may have been paged out since
+            text, self._pending = "".join(self._pending), []
+            self._insert_tail(text, self._following())
+        self._pending = [] # else it is rendered from the conversation when the tail is loaded again
+        for index in sorted(self._stale):
+            self._refresh_block(index)
+        self._stale.clear()
+
+    def _following(self):
+        '''True if the user is at the bottom (with the tail loaded), so new text should scroll into view.'''
+        return self.text.yview()[1] >= 0.999
+
+    def _insert_tail(self, text, follow):
+        self.text.config(state=tk.NORMAL)
+        self.text.insert("end-1c", text)
+        self.text.config(state=tk.DISABLED)
+        # re-render the last line, which may have been incomplete, and the new text
+        self._set_tail("end-1c linestart", self.markdown.render("md_tail", "end-1c", self._tail_fence))
+        if follow:
+            self.text.yview(tk.END)
+        self._schedule_page()
+
+    #%% Search hits
+    def show_hits(self, hits):
+        '''Highlight `hits`, (message index, start, end) as SearchIndex.find returns them.'''
+        self.flush() # the offsets are in the messages as they are now
+        self._hits = {}
+        for index, start, end in hits:
+            self._hits.setdefault(index, []).append((start, end))
+        self.text.tag_remove("search_hit", "1.0", tk.END)
+        self.text.tag_remove("search_current", "1.0", tk.END)
+        for index in range(self.first, self.last):
+            self._tag_hits(index)
+
+    def show_hit(self, index, start, end):
+        '''Scroll to one hit, loading its message if it is paged out, and mark it as the current one.'''
+        self.flush()
+        if not self.first <= index < self.last:
+            self._load_around(index)
+        self.text.tag_remove("search_current", "1.0", tk.END)
+        first, last = self._positions(index, (start, end))
+        self.text.tag_add("search_current", first, last)
+        self.text.see(first)
+
+    def top_message(self):
+        '''Index of the message at the top of the view.'''
+        top = self._view_top()[0]
+        index = self.first
+        while index + 1 < self.last and self._mark_line(index + 1) <= top:
+            index += 1
+        return index
+
+    def _tag_hits(self, index):
+        hits = self._hits.get(index)
+        if hits:
+            offsets = [offset for hit in hits for offset in hit]
+            self.text.tag_add("search_hit", *self._positions(index, offsets)) # one call for all the ranges
+
+    def _positions(self, index, offsets):
+        '''
+        Text widget indices of characters `offsets` (ascending) of message
+        `index`'s render(), rendering it and counting its lines only once.
+        '''
+        text = self.conversation[index].render()
+        line, column = (int(part) for part in self.text.index(f"block{index}").split("."))
+        positions = []
+        scanned = 0 # newlines before `scanned` are counted in `line`
+        line_start = None # offset of the current line in `text`, None while on the block's first line
+        for offset in offsets:
+            newline = text.find("\n", scanned, offset)
+            while newline >= 0:
+                line += 1
+                line_start = newline + 1
+                newline = text.find("\n", line_start, offset)
+            scanned = max(scanned, offset)
+            if line_start is None:
+                positions.append(f"{line}.{column + offset}")
+            else:
+                positions.append(f"{line}.{offset - line_start}")
+        return positions
+
+    #%% Scrolling
+    def see_end(self):
+        '''Scroll to the bottom, loading the last messages if they were paged out.'''
+        if self.last < len(self.conversation):
+            self._load_around(len(self.conversation) - 1)
+        else:
+            self.flush()
+        self.text.yview(tk.END)
+
+    def at_bottom(self):
+        '''True if the end of the transcript is visible.'''
+        return self.last >= len(self.conversation) and self.text.yview()[1] >= 0.999
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto": # dragged: jump to that line of the whole transcript
+            target = max(0.0, float(args[1])) * self.total_lines
+            index, before = 0, 0
+            while index < len(self.conversation) - 1 and before + self.conversation[index].lines <= target:
+                before += self.conversation[index].lines
+                index += 1
+            self._load_around(index, line=int(target - before))
+        else: # arrows and page clicks scroll what is loaded, _page() brings in more
+            self.text.yview(*args)
+
+    def _on_text_scrolled(self, first, last):
+        '''Show the position within the whole transcript, and page if near an edge.'''
+        first, last = float(first), float(last)
+        loaded = self._loaded_lines()
+        if self.first == 0 and self.last >= len(self.conversation): # everything is loaded
+            self.scrollbar.set(first, last)
+        else:
+            before = sum(message.lines for message in itertools.islice(self.conversation, self.first))
+            total = max(self.total_lines, 1)
+            self.scrollbar.set((before + first * loaded) / total, (before + last * loaded) / total)
+        margin = self.window_lines / (4 * max(loaded, 1))
+        if (first < margin and self.first > 0) or (last > 1 - margin and self.last < len(self.conversation)):
+            self._schedule_page()
+
+    def _schedule_page(self):
+        if not self._paging:
+            self._paging = True
+            self.after_idle(self._page)
+
+    def _page(self):
+        '''
+        Load the messages next to the viewport until there is a margin of
+        window_lines / 4 on both sides, then drop messages beyond the margins
+        until about window_lines are loaded. The view does not move.
+        '''
+        self._paging = False
+        if not self.winfo_exists() or not len(self.conversation):
+            return
+        margin = self.window_lines // 4
+        top, column = self._view_top()
+        old_first = self.first
+        while self.first > 0 and self._mark_line(old_first) - 1 + top - 1 < margin:
+            self.first -= 1
+            self._insert_block(self.first, "1.0")
+        if self.first != old_first:
+            top += self._mark_line(old_first) - 1
+            self.text.yview(f"{top}.{column}")
+        while self.last < len(self.conversation) and self._loaded_lines() - self._view_bottom() < margin:
+            self._insert_block(self.last, "end")
+            self.last += 1
+
+        while self.last - self.first > 1 and self._loaded_lines() > self.window_lines:
+            top, column = self._view_top()
+            above, below = top - 1, self._loaded_lines() - self._view_bottom()
+            first_size = self._mark_line(self.first + 1) - 1
+            can_drop_first = above - first_size >= margin
+            can_drop_last = self._mark_line(self.last - 1) - self._view_bottom() >= margin
+            if can_drop_first and (above > below or not can_drop_last):
+                self._remove_block(self.first)
+                self.first += 1
+                self.text.yview(f"{top - first_size}.{column}")
+            elif can_drop_last:
+                self.last -= 1
+                self._remove_block(self.last)
+            else: # the viewport is bigger than the window, keep everything
+                break
+
+    def _load_around(self, index, line=0):
+        '''Fill the text widget with the messages around message `index` and show its `line`.'''
+        self._empty()
+        if not len(self.conversation):
+            return
+        self.first = index
+        lines = 0
+        while self.first > 0 and lines < self.window_lines // 4:
+            self.first -= 1
+            lines += self.conversation[self.first].lines
+        self.last = self.first
+        while self.last < len(self.conversation) and (self.last <= index or lines < self.window_lines):
+            self._insert_block(self.last, "end")
+            lines += self.conversation[self.last].lines
+            self.last += 1
+        self.text.yview(f"{self._mark_line(index) + line}.0")
+
+    #%% Text widget bookkeeping
+    def _empty(self):
+        self.first = self.last = 0
+        self._pending = [] # whatever gets loaded is rendered from the conversation, pending text included
+        self._stale.clear()
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.config(state=tk.DISABLED)
+        for mark in self.text.mark_names():
+            if mark.startswith("block"):
+                self.text.mark_unset(mark)
+
+    def _loaded_lines(self):
+        return int(self.text.index("end-1c").split(".")[0])
+
+    def _view_top(self):
+        '''(line, column) of the first character in view.'''
+        line, column = self.text.index("@0,0").split(".")
+        return int(line), int(column)
+
+    def _view_bottom(self):
+        return int(self.text.index(f"@0,{self.text.winfo_height()}").split(".")[0])
+
+    def _mark_line(self, index):
+        '''Line of the text widget where message `index` starts.'''
+        return int(self.text.index(f"block{index}").split(".")[0])
+
+    def _set_block_mark(self, index, where):
+        self.text.mark_set(f"block{index}", where)
+        self.text.mark_gravity(f"block{index}", tk.LEFT) # text inserted at the mark goes after it
+
+    def _insert_block(self, index, where):
+        '''Put message `index` in the text widget, at "1.0" or the "end".'''
+        self.text.config(state=tk.NORMAL)
+        if where == "1.0":
+            self.text.mark_gravity(f"block{index + 1}", tk.RIGHT) # the next block now starts further down
+            self.text.insert("1.0", self.conversation[index].render())
+            self.text.mark_gravity(f"block{index + 1}", tk.LEFT)
+            self._set_block_mark(index, "1.0")
+        else:
+            self._set_block_mark(index, "end-1c")
+            self.text.insert("end-1c", self.conversation[index].render())
+        self.text.config(state=tk.DISABLED)
+        end = "end-1c" if where == "end" else f"block{index + 1}"
+        fence = self.markdown.render(f"block{index}", end)
+        self._tag_hits(index)
+        if index == len(self.conversation) - 1: # the end of the conversation, may still grow
+            self._set_tail("end-1c linestart", fence)
+
+    def _refresh_block(self, index):
+        '''Render message `index` (loaded, not the last one) again, it changed.'''
+        follow = self._following()
+        end = f"block{index + 1}" if index + 1 < self.last else "end-1c"
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(f"block{index}", end)
+        if index + 1 < self.last:
+            self.text.mark_gravity(end, tk.RIGHT) # the next block starts after the new text
+        self.text.insert(f"block{index}", self.conversation[index].render())
+        if index + 1 < self.last:
+            self.text.mark_gravity(end, tk.LEFT)
+        self.text.config(state=tk.DISABLED)
+        self.markdown.render(f"block{index}", end)
+        self._tag_hits(index)
+        if follow:
+            self.text.yview(tk.END)
+
+    def _set_tail(self, where, fence):
+        self.text.mark_set("md_tail", where)
+        self.text.mark_gravity("md_tail", tk.LEFT)
+        self._tail_fence = fence
+
+    def _remove_block(self, index):
+        '''Take message `index` (the first or last one loaded) out of the text widget.'''
+        end = f"block{index + 1}" if index + 1 < self.last else "end-1c"
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(f"block{index}", end)
+        self.text.config(state=tk.DISABLED)
+        self.text.mark_unset(f"block{index}")
+        self._stale.discard(index)
+        if index == len(self.conversation) - 1: # the tail: its streamed text must not go to the new last block
+            self._pending = []
+            if self._flush_id is not None and not self._stale:
+                self.after_cancel(self._flush_id)
+                self._flush_id = None
@@ -5,64 +5,367 @@ Copyright (c) 2025, MIT License
 '''
 
 # src/main.py
+import time
+_T0 = time.perf_counter() # start of the cold start budget, see utils/startup.py
+
 from gui.chat_window import ChatWindow as baseGUI
 import tkinter as tk #Debug, this code should be moved to utils
+import threading
 
 # Add Backend to ChatWindow
-import subprocess
+# Only what the window needs to appear is imported here. The backend
+# (HTTP client, subprocess, SQLite, logging) is imported after the first
+# paint, see _Shared and OllamaGui._on_first_paint.
+from utils.errors import LLMConnectionError
+from utils.cancel import CancelToken
+from utils.workers import TkWorker
+from utils.chat_context import ChatContext, DEFAULT_NUM_CTX
+from utils.conversation import HEADERS, CACHED_HEADER, STOPPED
+from utils.warmup import DEFAULT_KEEP_ALIVE
+from utils.scheduler import shared_scheduler, FOREGROUND, BACKGROUND
+from utils.startup import StartupTimer
+
+startup = StartupTimer(_T0)
+startup.mark("imports")
 
-### Define Errors
-class LLMConnectionError(Exception):
-    pass
+# Headers in front of each answer in the transcript
+REPLY_HEADER = f'\n{HEADERS["assistant"]}:\n'
+CACHED_REPLY_HEADER = f'\n{CACHED_HEADER}:\n'
 
 
 ### Define Classes
+class _Shared:
+    """
+    Class attribute built by `factory(cls)` the first time it is read, from
+    any thread, then stored on the class in place of this descriptor.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+
+    def __set_name__(self, owner, name):
+        self.owner, self.name = owner, name
+
+    def __get__(self, obj, objtype=None):
+        with self._lock:
+            value = self.owner.__dict__[self.name]
+            if value is self: # first use
+                value = self.factory(self.owner)
+                setattr(self.owner, self.name, value)
+        return value
+
+
 class OllamaGui(baseGUI):
     """
     Custom class that builds a GUI interface for Ollama and other self hosted LLMs.
     """
+    # The LLM backend shared by every window (one keep-alive connection pool).
+    # Ollama by default, see utils/providers.py and OLLAMAGUI_PROVIDER for the others.
+    @_Shared
+    def provider(cls):
+        from utils.providers import make_provider
+        return make_provider()
+
+    @_Shared
+    def container(cls): # None if the backend doesn't run in a container
+        container = cls.provider.container
+        if container is not None:
+            container.server_type = "podman" # or docker, set once for every window
+        return container
+
+    # Loads models in the background and keeps them loaded while windows use them
+    @_Shared
+    def warmer(cls):
+        from utils.warmup import ModelWarmer
+        return ModelWarmer(cls.provider)
+
+    # Cheap, cached server status checks and container repairs
+    @_Shared
+    def health(cls):
+        from utils.health import HealthMonitor
+        return HealthMonitor(cls.provider, cls.container)
+
+    # Stops the container service once the last window has been closed for a while (OLLAMAGUI_IDLE_TIMEOUT)
+    @_Shared
+    def lifecycle(cls):
+        from utils.lifecycle import ContainerLifecycle, default_idle_timeout
+        return ContainerLifecycle(cls.container, idle_timeout=default_idle_timeout())
+
+    # Queue shared by every window, keeps the server from being oversubscribed
+    scheduler = shared_scheduler()
+
+    # Answers to deterministic prompts, kept across sessions
+    @_Shared
+    def response_cache(cls):
+        from utils.response_cache import ResponseCache, default_cache_path
+        return ResponseCache(default_cache_path())
+
+    # Timings of every request, one JSON line each (rotated)
+    @_Shared
+    def metrics_log(cls):
+        from utils.metrics import MetricsLog
+        return MetricsLog()
+
     def __init__(self):
         super().__init__()
         
         # Set Default Settings
         self.model = "codellama" # or whichever model
-        self.server_type = "podman" # or docker
+        self.stream = True # show the response token by token as it is generated
+        self.keep_alive = DEFAULT_KEEP_ALIVE # how long the server keeps the model loaded after a request
+        self.context_sizes = {} # num_ctx per model, set through Options->Context
+        
+        # Earlier turns, sent back to the model when Options->Context->Remember Conversation is on
+        self.chat_context = ChatContext(num_ctx=self.num_ctx)
+        self._reply = None # the streaming answer's Message, once its first piece arrived
+        self._cancel = None # CancelToken of the request in flight, see stop_prompt
+        self._metrics = None # RequestMetrics of the request in flight
+        self._status_updated = 0.0 # when the live tokens/s were last shown
+        
+        # Model state returned by /api/generate, lets the server skip re-reading the conversation
+        self.llm_context = None
+        self._llm_context_model = None # the model that produced llm_context
+        
+        # Runs backend calls in the background so the window never freezes
+        self.worker = TkWorker(self)
+        
+        # The focused window's requests go first, see utils/scheduler.py
+        self._has_focus = True
+        self.bind("<FocusIn>", lambda event: setattr(self, "_has_focus", True), add="+")
+        self.bind("<FocusOut>", lambda event: setattr(self, "_has_focus", False), add="+")
         
-        # LLM server related things
-        self.update_idletasks() # ensure the widget has updated
         # uncomment to close all servers when Xed out
-        self.protocol("WM_DELETE_WINDOW", self.exit)
+        self.protocol("WM_DELETE_WINDOW", self._timed(self.exit))
+
+        # Nothing slow before the window is on screen: the backend is loaded,
+        # and the server probed, once it has been painted
+        self._painted = False
+        self._backend_loaded = False # this window holds the lifecycle and the warm model
+        self.bind("<Map>", self._on_map, add="+")
+        startup.mark("widgets")
+
+    def _on_map(self, event):
+        if event.widget is self and not self._painted:
+            self._painted = True
+            self.after_idle(self._on_first_paint)
+
+    def _on_first_paint(self):
+        self.update_idletasks() # finish drawing before starting anything else
+        startup.mark("first paint")
+        if not any(isinstance(value, _Shared) for value in vars(OllamaGui).values()):
+            self._on_backend_loaded(None) # another window already loaded it
+            return
+        self.set_status('Loading backend...')
+        self.worker.submit(self._load_backend, on_done=self._on_backend_loaded,
+                           on_error=self._on_backend_failed)
 
+    def _load_backend(self):
+        '''Worker thread: import and build the shared backend objects.'''
+        for name in ("provider", "container", "warmer", "health", "lifecycle", "response_cache", "metrics_log"):
+            getattr(OllamaGui, name)
+
+    def _on_backend_loaded(self, result):
+        # Keep the container service up while this window is open
+        self.lifecycle.acquire()
+        self._backend_loaded = True
+        # Load the model in the background, the user can start typing right away
+        self.warm_up_model()
+
+    def _on_backend_failed(self, error):
+        print(f'Backend failed to load: {error}') # debug
+        self.set_status('Backend unavailable')
+        self.push_to_chat_window(f'{error}')
+        self._on_backend_ready()
+
+    def _on_backend_ready(self):
+        '''The model is loaded, or we know why it can't be. Ends the startup timing.'''
+        startup.mark("backend ready")
+        startup.report()
+
+    def warm_up_model(self):
+        '''Preload the model in the background and keep it loaded while this window is open.'''
+        self.set_status(f'Loading {self.model}...')
+        self.warmer.keep_alive = self.keep_alive
+        self.warmer.hold(self.model, self._request_options())
+        if self.warmer.is_loaded(self.model): # another window keeps it loaded, no need to ask the server
+            self._on_model_loaded(None)
+            return
+        self.worker.submit(self.warmer.warm, self.model, self._request_options(),
+                           on_done=self._on_model_loaded,
+                           on_error=self._on_warm_up_failed)
+
+    def _on_model_loaded(self, reply):
+        self._on_backend_ready()
+        self.set_status(f'{self.model} ready')
+        self.push_to_chat_window(r'Hello World!')
+
+    def _on_warm_up_failed(self, error):
         # Check if LLM service is running and start/fix it if possible
-        connectionStatus , errorMsg = self.test_LLM_connection(fix=True, previousAttempt=None)
-        if connectionStatus:
-            self.push_to_chat_window(r'Hello World!')
-        else:
+        print(f'Warm up failed: {error}') # debug
+        self.set_status(f'Starting {self.model}...')
+        self.health.invalidate()
+        self.worker.submit(self.health.ensure, on_done=self._on_connection_tested)
+
+    def _on_connection_tested(self, result):
+        from utils.health import CLI_ONLY
+        connectionStatus , errorMsg = result
+        if not connectionStatus:
+            self._on_backend_ready()
+            self.set_status(f'{self.model} unavailable: {self.health.description}')
             self.push_to_chat_window(f'{errorMsg}')
+        elif self.health.status == CLI_ONLY: # can't preload without the API, the first prompt will load it
+            self._on_backend_ready()
+            self.set_status(self.health.description)
+            self.push_to_chat_window(r'Hello World!')
+        else: # server is back, try loading the model once more
+            self.worker.submit(self.warmer.warm, self.model, self._request_options(),
+                               on_done=self._on_model_loaded,
+                               on_error=self._on_model_unavailable)
+
+    def _on_model_unavailable(self, error):
+        self._on_backend_ready()
+        self.set_status(f'{self.model} unavailable')
+        self.push_to_chat_window(f'{error}')
 
 
     #%% Ollama Related methods/properties
     @property
-    def prefix(self):
-        prefix = self.server_type + r' exec ollama ollama run ' + self.model
-        
-        return prefix
+    def server_type(self):
+        '''"podman" or "docker", shared by every window.'''
+        return self.container.server_type if self.container is not None else None
+
+    @server_type.setter
+    def server_type(self, value):
+        self.container.server_type = value
+
+    @property
+    def max_parallel(self):
+        '''Requests sent to the server at once, across all windows.'''
+        return self.scheduler.max_concurrent
+
+    @max_parallel.setter
+    def max_parallel(self, value):
+        self.scheduler.max_concurrent = value
+
+    def _priority(self):
+        '''Scheduler priority of this window's requests, read again while they wait.'''
+        return FOREGROUND if self._has_focus else BACKGROUND
+
+    def _request_slot(self, cancel=None, metrics=None):
+        '''
+        Wait (in a worker thread) for the scheduler to let a request through,
+        showing the queue position in the status bar. See RequestScheduler.slot.
+        '''
+        def on_position(position):
+            if position == 0 and metrics is not None:
+                metrics.mark_started()
+            self.worker.call_soon(self._show_queue_position, position)
+        return self.scheduler.slot(self._priority, cancel, on_position=on_position)
+
+    def _show_queue_position(self, position):
+        if position:
+            self.set_status(f'Queued, position {position} (max {self.max_parallel} at once)')
+        else:
+            self.set_status(f'{self.model} generating...')
+
+    @property
+    def num_ctx(self):
+        '''Context window (tokens) for the current model.'''
+        return self.context_sizes.get(self.model, DEFAULT_NUM_CTX)
+
+    @num_ctx.setter
+    def num_ctx(self, value):
+        self.context_sizes[self.model] = value
+
+    def _request_options(self):
+        '''
+        Model options sent with every request. num_ctx must be the same on
+        every request, otherwise Ollama reloads the model to resize it.
+        '''
+        options = {"num_ctx": self.num_ctx}
+        if self.deterministic.get():
+            options.update(temperature=0, seed=0)
+        return options
+
+    def context_changed(self):
+        '''Apply the Options->Context settings.'''
+        self.chat_context.num_ctx = self.num_ctx
+        if self.context_mode.get() != "server":
+            self.llm_context = None
+        print(f'Context mode: {self.context_mode.get()}, num_ctx: {self.num_ctx}') # debug
+
+    def conversation_reset(self):
+        '''The conversation was replaced (a transcript was opened): remember its exchanges instead.'''
+        self.chat_context.clear()
+        for prompt, answer in self.conversation.exchanges():
+            self.chat_context.add_exchange(prompt.content, answer.content, reply_tokens=answer.tokens)
+        self.llm_context = None # the server's context was for the old conversation
+
+    def _server_context(self):
+        '''
+        The /api/generate context to send with the next prompt, or None if it
+        no longer matches the conversation (other model).
+        '''
+        if self.llm_context is None:
+            return None
+        if self._llm_context_model != self.model:
+            print('Conversation changed, discarding server context') # debug
+            self.llm_context = None
+            return None
+        return self.llm_context
+
+    def clear_cache(self):
+        self.response_cache.clear()
+        self.set_status('Response cache cleared')
+
+    def _cache_key(self, prompt, messages, context, options):
+        '''Cache key of a request, looks up the model digest so call it from a worker thread.'''
+        from utils.response_cache import make_key
+        messages = messages or [{"role": "user", "content": prompt}]
+        return make_key(self.provider.model_digest(self.model), options, messages, context)
+
+    def _cached_response(self, key, result):
+        '''The cached answer for `key` or None. Fills `result` like the backend would.'''
+        cached = self.response_cache.get(key)
+        if cached is None:
+            return None
+        response, meta = cached
+        if result is not None:
+            result.update(meta, cached=True)
+        print(f'Cache hit {key[:12]}') # debug
+        return response
+
+    def _cache_response(self, key, response, result):
+        '''Remember a complete answer.'''
+        if result is None or not result.get("done"): # incomplete, or the backend didn't say
+            return
+        meta = {k: v for k, v in result.items() if k not in ("response", "message", "cached")}
+        self.response_cache.put(key, response, meta)
+
+    def _store_context(self, result):
+        '''Keep the context returned with the last response for the next prompt.'''
+        if "context" in result:
+            self.llm_context = result["context"]
+            self._llm_context_model = result.get("model", self.model)
 
         
     def exit(self):
-        '''Tells the program to close all servers when Xed out'''
-        #TODO We should only close the server if ALL windows are closed
-        # Perhaps we keep track of the number of open windows with a class variable?
-        print('Stopping Container Service and Closing GUI\n\n')
-        self.stop_server()
+        '''
+        Tells the program to close the servers when Xed out. They are only
+        stopped once ALL windows are closed and the idle timeout has passed.
+        '''
+        print('Closing GUI\n\n')
+        if self._cancel is not None: # don't leave the server generating for a closed window
+            self._cancel.cancel()
+        self.worker.close() # drop any results still on their way to this window
+        if self._backend_loaded: # closed before the backend was loaded: nothing to release
+            self.warmer.release(self.model)
+            self.lifecycle.release()
         self.destroy()
 
     def push_to_chat_window(self, text):
         # Send the text to the chat window
-        self.chat_history.config(state=tk.NORMAL) # enable changing text
-        self.chat_history.insert(tk.INSERT, "\nANNOUNCMENT:\n" + text + '\n') # insert text
-        self.chat_history.yview(tk.END) # scroll to bottom
-        self.chat_history.config(state=tk.DISABLED) # disable changing text
+        self.add_message("notice", text)
 
     # I feel like this should be folded into the baseGUI somehow
     def send_prompt(self):
@@ -72,46 +375,178 @@ class OllamaGui(baseGUI):
         
         See _send_command for interacting with the LLM server.
         """
-        
+
+        # The provider, cache and metrics are built by _load_backend, building
+        # them here would freeze the window. The prompt stays in the entry box.
+        if not self._backend_loaded:
+            self.set_status('Backend not loaded, the prompt was not sent')
+            return 0
+
         # Get the prompt from the user
         prompt = self.user_prompt.get("1.0" , tk.END)
         print(prompt) # debug
         
-        # Send the prompt to the chat window
-        self.chat_history.config(state=tk.NORMAL) # enable changing text
-        self.chat_history.insert(tk.INSERT, "\nUser:\n" + prompt + '\n') # insert prompt
-        self.chat_history.yview(tk.END) # scroll to bottom
-        self.chat_history.config(state=tk.DISABLED) # disable changing text
+        # Decide what to remember before the transcript changes below
+        mode = self.context_mode.get()
+        context = self._server_context() if mode == "server" else None
+        
+        # Send the prompt to the chat window, scrolling down to it
+        self.add_message("user", prompt)
+        self.chat_history.see_end()
         
         # Clear the entry widget
         self.user_prompt.delete('1.0', tk.END)
         
-        # ensure the widget has updated before continuing
-        self.chat_history.update_idletasks()  
+        # Show the request is in flight until the response has arrived
+        self._set_busy(True)
         
-        # send prompt to LLM
-        try:
-            response = self._send_command(prompt)
-        except FileNotFoundError:
+        # Include the earlier turns (trimmed to fit num_ctx) if we are remembering the conversation
+        self._pending_prompt = prompt
+        messages = self.chat_context.messages(prompt) if mode == "chat" else None
+        self._result = {} # filled in by the backend with the final response fields (context, timings...)
+        from utils.metrics import RequestMetrics # already imported by _load_backend
+        from utils.response_cache import is_deterministic
+        self._cancel = CancelToken() # Stop button
+        self._metrics = RequestMetrics(self.model, self.provider.name, context_mode=mode, stream=self.stream,
+                                       turn=len(self.conversation), conversation_tokens=self.conversation.tokens)
+        
+        # Read the Tk variables here, the commands below run in a worker thread
+        options = self._request_options()
+        
+        # Only deterministic requests may be answered from the cache
+        use_cache = (self.use_cache.get() and not self.bypass_cache_once
+                     and is_deterministic(options))
+        self.bypass_cache_once = False
+        
+        # send prompt to LLM in the background, the callbacks update the chat window
+        if self.stream:
+            self._reply = None # the header is written with the first piece, once we know if it was cached
+            self.worker.submit_iter(self._stream_command, prompt, messages=messages, options=options,
+                                    context=context, result=self._result, use_cache=use_cache,
+                                    cancel=self._cancel, metrics=self._metrics,
+                                    on_item=self._on_stream_item,
+                                    on_done=self._on_stream_done,
+                                    on_error=self._on_prompt_error)
+        else:
+            self.worker.submit(self._send_command, prompt, messages=messages, options=options,
+                               context=context, result=self._result, use_cache=use_cache,
+                               cancel=self._cancel, metrics=self._metrics,
+                               on_done=self._on_response,
+                               on_error=self._on_prompt_error)
+        
+        return 0
+
+    def stop_prompt(self):
+        '''
+        Stop the response being generated. The connection is closed (or the
+        `ollama run` process killed), which makes the server stop generating
+        and free its slot right away. What arrived so far stays in the transcript.
+        '''
+        if self._cancel is None or self._cancel.cancelled:
+            return
+        print('Stopping the response') # debug
+        self.set_status('Stopping...')
+        self.stop_button.config(state=tk.DISABLED)
+        self._cancel.cancel()
+
+    def _stopped(self):
+        '''True if the request that just finished was stopped by the user.'''
+        return self._cancel is not None and self._cancel.cancelled
+
+    def _set_busy(self, busy):
+        '''Show in the Send/Stop buttons whether a request is in flight.'''
+        # File->Open would replace the conversation the answer is going into
+        self.file_menu.entryconfig("Open", state=tk.DISABLED if busy else tk.NORMAL)
+        if busy:
+            self.send_button.config(state=tk.DISABLED, text="Sending...")
+            self.stop_button.config(state=tk.NORMAL)
+        else:
+            self.send_button.config(state=tk.NORMAL, text="Send")
+            self.stop_button.config(state=tk.DISABLED)
+            self._cancel = None
+
+    def _finish_metrics(self, error=None):
+        '''Log the finished request's metrics and show them in the status bar.'''
+        metrics, self._metrics = self._metrics, None
+        if metrics is None:
+            return
+        if metrics.finished_at is None or error is not None: # not already marked by the worker
+            metrics.mark_finished(self._result, error=error, stopped=self._stopped())
+        self.metrics_log.write(metrics)
+        if error is None:
+            self.set_status(f'{self.model}: {metrics.summary()}')
+
+    def _on_response(self, response):
+        # Send LLM response to chat window
+        for header in (REPLY_HEADER, CACHED_REPLY_HEADER):
+            if response.startswith(header): # not an error message
+                answer = response[len(header):].rstrip("\n")
+                stopped = answer.endswith(STOPPED)
+                reply = self.add_message("assistant", answer[:-len(STOPPED)] if stopped else answer, finished=False,
+                                         model=self.model, cached=header == CACHED_REPLY_HEADER)
+                self.finish_message(reply, self._result.get("eval_count"), stopped)
+                self.chat_context.add_exchange(self._pending_prompt, reply.content, reply_tokens=reply.tokens)
+                self._store_context(self._result)
+                break
+        else:
+            self.add_message("text", response)
+        self._finish_metrics()
+        self._set_busy(False)
+
+    def _start_reply(self):
+        '''Add the streamed answer's message, marking it if it came from the cache.'''
+        if self._reply is None:
+            self._reply = self.add_message("assistant", finished=False, model=self.model,
+                                           cached=bool(self._result.get("cached")))
+
+    def _on_stream_item(self, text):
+        self._start_reply()
+        self.extend_message(self._reply, text)
+        now = time.perf_counter()
+        if self._metrics is not None and now - self._status_updated > 0.5: # live tokens/s
+            self._status_updated = now
+            self.set_status(f'{self.model} generating: {self._metrics.summary()}')
+
+    def _on_stream_done(self):
+        self._start_reply()
+        self.finish_message(self._reply, self._result.get("eval_count"), self._stopped())
+        self.chat_context.add_exchange(self._pending_prompt, self._reply.content, reply_tokens=self._reply.tokens)
+        self._store_context(self._result)
+        self._reply = None
+        self._finish_metrics()
+        self._set_busy(False)
+
+    def _on_prompt_error(self, error):
+        '''Report a failed request, then check (and fix) the server in the background.'''
+        self._finish_metrics(error)
+        if isinstance(error, FileNotFoundError):
             errorMsg = "FileNotFoundError\nAre you sure your prefix is set correctly?\nIs Ollama installed?"
             print(errorMsg)
             self.push_to_chat_window(errorMsg)
-            return 1
-        except LLMConnectionError:
-            self.test_LLM_connection(fix=True, previousAttempt=response)
-        
-        # Send LLM response to chat window
-        self.chat_history.config(state=tk.NORMAL) # enable changing text
-        self.chat_history.insert(tk.INSERT, response)
-        self.chat_history.yview(tk.END) # scroll to bottom
-        self.chat_history.config(state=tk.DISABLED) # disable changing text
+            self._set_busy(False)
+            return
         
-        return 0
+        errorMessage = '\nOops! Something went wrong!\n{}\n'.format(error)
+        print(errorMessage)
+        if self._reply is not None and self._reply.finished is None: # failed halfway through the answer
+            self.finish_message(self._reply)
+        self._reply = None
+        self.add_message("text", errorMessage)
+        self.health.invalidate()
+        self.worker.submit(self.health.ensure, on_done=self._on_connection_repaired)
+
+    def _on_connection_repaired(self, result):
+        connectionStatus, errorMsg = result
+        if not connectionStatus:
+            self.push_to_chat_window(errorMsg)
+        self.set_status(self.health.description)
+        self._set_busy(False)
 
 
     #%% Define backed / interface / debug functions
     #TODO move these to a seperate backend script
-    def _send_command(self, prompt, formatResponse=True, fix=True):
+    def _send_command(self, prompt, formatResponse=True, fix=True, messages=None, options=None, context=None,
+                      result=None, use_cache=False, cancel=None, metrics=None):
         '''
         Send a command to the LLM. 
 
@@ -120,148 +555,133 @@ class OllamaGui(baseGUI):
         prompt : str
             Raw user input. Often a question or request to the LLM.
         formatResponse : bool, optional
-            subprocess.run() returns a CompletedProcess object. If formatResponse
-            is set to False, this function returns the raw CompletedProcess.
-            Otherwise, a plain text response extracted, formated, and returned.
-            The default is True.
+            If formatResponse is set to False, this function returns the raw
+            response text. Otherwise, the response is formated for the chat
+            window. The default is True.
+        fix : bool, optional
+            On failure, check (and repair) the server then try once more.
+        messages : list of dict, optional
+            Full message list (earlier turns + prompt) for multi-turn chats.
+            The CLI fallback can only send the prompt itself.
+        options : dict, optional
+            Model options, see _request_options. Pass them when calling from
+            a worker thread, building them reads Tk variables.
+        context : list of int, optional
+            The "context" returned by the previous /api/generate call.
+        result : dict, optional
+            If given, it is updated with the raw fields of the final response
+            (including the new "context").
+        use_cache : bool, optional
+            Answer from the response cache if this exact request was answered
+            before, and cache the new answer otherwise. Only for deterministic
+            options. Cached answers are marked in the formatted response.
+        cancel : CancelToken, optional
+            Cancelling it stops the generation, the text generated so far is
+            returned (marked as stopped in the formatted response).
+        metrics : RequestMetrics, optional
+            Gets the timings and the server's token counts.
 
         Returns
         -------
-        response : str or subprocess.run CompletedProcess object
-            subprocess.run() returns a CompletedProcess object. If formatResponse
-            is set to False, this function returns the raw CompletedProcess.
-            Otherwise, a plain text response extracted, formated, and returned.
+        response : str
+            The response text, or an error message if the request failed.
 
         '''
-        # Format message
-        prefix = self.prefix.split(" ")
-        command = prefix + [prompt]
-        print(command) # debug
-        
         # send prompt and capture response
-        response = subprocess.run(command, capture_output=True)
-
-        # Check for errors and return response
-        if response.returncode != 0: # if there was an error
-            errorMessage = '\nOops! Something went wrong! Error Code: {}\n\n'.format(response.returncode)
-            # We could also decode the stderr, but that should already be printed for us
+        if options is None:
+            options = self._request_options()
+        header = REPLY_HEADER
+        try:
+            key = self._cache_key(prompt, messages, context, options) if use_cache else None
+            response = self._cached_response(key, result) if key else None
+            if response is not None:
+                header = CACHED_REPLY_HEADER
+            else:
+                with self._request_slot(cancel, metrics) as granted:
+                    response = "" # stopped while queued
+                    if granted:
+                        response = self.provider.generate(self.model, prompt, messages, options, context,
+                                                          keep_alive=self.keep_alive, cancel=cancel, result=result)
+                if cancel is not None and cancel.cancelled:
+                    response += " [stopped]"
+                elif key:
+                    self._cache_response(key, response, result)
+            if metrics is not None:
+                metrics.mark_finished(result, stopped=cancel is not None and cancel.cancelled)
+        except LLMConnectionError as e: # if there was an error
+            if cancel is not None and cancel.cancelled: # stopped before anything arrived
+                return header + "[stopped]\n" if formatResponse else ""
+            errorMessage = '\nOops! Something went wrong!\n{}\n\n'.format(e)
             print(errorMessage)
             
             # see if LLM service is running and fix it if possible
-            # Warning! Recursion!
             if fix:
-                connectionStatus, errorMsg = self.test_LLM_connection(fix=True, previousAttempt=response) #recursive
-                if connectionStatus: # fixed connection, re-try
-                    response = self._send_command(prompt, formatResponse, fix=False) # recursive, fix=False to prevent looping
-                else:
-                    response = errorMessage + errorMsg 
-            else:
-                response = errorMessage
-            
-        elif formatResponse:        
-            # decode byte response
-            response = str(response.stdout.decode()) # str is probably overkill, but I suspect safer 
-            response = "\nOllama:\n" + response +"\n"
+                self.health.invalidate() # the cached status is clearly out of date
+                connectionStatus, errorMsg = self.health.ensure()
+                if connectionStatus: # fixed connection, re-try once
+                    return self._send_command(prompt, formatResponse, fix=False, messages=messages, options=options,
+                                              context=context, result=result,
+                                              use_cache=use_cache, cancel=cancel, metrics=metrics) # fix=False to prevent looping
+                return errorMessage + errorMsg
+            return errorMessage
+        
+        if formatResponse:
+            response = header + response +"\n"
             print(response) #debug
-        else:
-            pass
-
 
         return response
 
-    
-    def test_LLM_connection(self, fix, previousAttempt):
+
+    def _stream_command(self, prompt, messages=None, options=None, context=None, result=None, use_cache=False,
+                        cancel=None, metrics=None):
         '''
-        Test connection to LLM and attempt to fix it.
+        Streaming version of _send_command. Yields the response text piece by
+        piece as the model generates it. See _send_command for the parameters,
+        a cached answer comes in one piece with result["cached"] set.
         
-        connectionStatus = True # success , connected to LLM
-        connectionStatus = False # failure, NOT connected to LLM, default return
+        Raises LLMConnectionError if the server reports an error.
         '''
-        connectionStatus = False # default return, failed connection
-        errorMsg = ""
-        
-        try:
-            if previousAttempt is None:
-                response = self._send_command(r"hello", formatResponse=False, fix = False) # fix = False to prevent recursion
-            else:
-                response = previousAttempt
-                
-            #TODO Errors are only for podman currently
-            if response.returncode == 0: # no error, all good
-                connectionStatus = True # success
-                
-            elif fix: # if there is an error, try to debug
-                stderr = response.stderr.decode()
-                print(stderr)
-                if r"container state improper" in stderr:
-                    print('Trying to start Ollama container...\n\n')
-                    response = self.start_ollama_container()
-                    stderr = response.stderr.decode()
-                    print(stderr)
-                
-                if r"unable to connect to Podman socket" in stderr:
-                    print('Trying to start container service...\n\n')
-                    response = self.start_server()
-                    stderr = response.stderr.decode()
-                    print(stderr)
-                    
-                    print('Trying to start Ollama container...\n\n')
-                    response = self.start_ollama_container()
-                    stderr = response.stderr.decode()
-                    print(stderr)
-             
-                # Trying again
-                print('Testing LLM again...\n\n')
-                response = self._send_command(r"hello", formatResponse=False, fix=False) # fix=False to prevent recursion
-                stderr = response.stderr.decode()
-                
-                
-                if response.returncode == 0: # no error, all good
-                    connectionStatus = True # success
-                else:
-                    print(stderr)
-                    errorMsg = stderr
-                    
-        
-        except FileNotFoundError:
-            # One way to generate this error is to try and run the script
-            # on a computer that doesn't have ollama/docker/podman
-            # ...ask me how I know...
-            errorMsg = "FileNotFoundError\nAre you sure your prefix is set correctly?\nIs Ollama installed?"
-            print(errorMsg)
-            #connectionStatus = False # default
+        if options is None:
+            options = self._request_options()
+        key = self._cache_key(prompt, messages, context, options) if use_cache else None
+        response = self._cached_response(key, result) if key else None
+        if response is not None:
+            if metrics is not None:
+                metrics.mark_token()
+                metrics.mark_finished(result)
+            yield response
+            return
         
-        return ( connectionStatus , errorMsg )
-    
-    
-
+        parts = []
+        with self._request_slot(cancel, metrics) as granted:
+            if not granted: # stopped while queued
+                return
+            for text in self.provider.stream(self.model, prompt, messages, options, context,
+                                             keep_alive=self.keep_alive, cancel=cancel, result=result):
+                if metrics is not None and text:
+                    metrics.mark_token()
+                parts.append(text)
+                yield text
+        if metrics is not None:
+            metrics.mark_finished(result, stopped=cancel is not None and cancel.cancelled)
+        if key and not (cancel is not None and cancel.cancelled): # never cache a partial answer
+            self._cache_response(key, "".join(parts), result)
 
+    
     def start_server(self):
-        if self.server_type == 'podman':
-            command = r'podman machine start'
-        elif self.server_type == 'docker':
-            pass #command = r'docker start' # TODO
-        
-        return subprocess.run(command, capture_output=True)
+        return self.container.machine_start()
     
     
     def stop_server(self):
-        if self.server_type == 'podman':
-            command = r'podman machine stop'
-        elif self.server_type == 'docker':
-            pass #command = r'docker start' # TODO
-        
-        return subprocess.run(command, capture_output=True)
+        return self.container.machine_stop()
 
 
     def start_ollama_container(self):
-        command = self.server_type + r' start ollama'
-        return subprocess.run(command, capture_output=True)
+        return self.container.container_start()
 
     
     def stop_ollama_container(self):
-        command = self.server_type + r' stop ollama'
-        return subprocess.run(command, capture_output=True)
+        return self.container.container_stop()
 
 
 
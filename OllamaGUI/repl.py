@@ -0,0 +1,198 @@
+'''
+Chat with an LLM from the terminal, no display needed.
+
+Uses the same backend as the GUI (providers, context handling, keep-alive)
+and saves transcripts in the same Markdown format, so a conversation can be
+opened in the GUI afterwards. Nothing is loaded before the prompt appears:
+the model is warmed up in the background while you type.
+
+    python repl.py --model codellama
+
+End a line with \\ to keep typing on the next one. Ctrl+C stops the answer
+being generated, Ctrl+D (Ctrl+Z on Windows) or /quit exits. /help lists the
+other commands.
+'''
+
+# src/repl.py
+import argparse
+import datetime
+import os
+import sys
+import threading
+
+from utils.errors import LLMConnectionError
+from utils.providers import make_provider
+from utils.cancel import CancelToken
+from utils.chat_context import ChatContext, DEFAULT_NUM_CTX
+from utils.conversation import Conversation, STOPPED
+from utils.warmup import DEFAULT_KEEP_ALIVE
+
+HELP = """Commands:
+  /save [file]    save the transcript (Markdown, same format as the GUI)
+  /model [name]   show or switch the model
+  /clear          forget the conversation
+  /help           show this help
+  /quit           exit"""
+
+
+class Repl:
+    """
+    Terminal chat session.
+
+    Parameters
+    ----------
+    provider : LLMProvider
+    model : str
+    context_mode : str, optional
+        "none", "chat" or "server", like Options->Context in the GUI.
+    num_ctx : int, optional
+    keep_alive : str, optional
+    output : file, optional
+        Where answers are printed.
+    """
+    def __init__(self, provider, model, context_mode="chat", num_ctx=DEFAULT_NUM_CTX,
+                 keep_alive=DEFAULT_KEEP_ALIVE, output=sys.stdout):
+        self.provider = provider
+        self.model = model
+        self.context_mode = context_mode
+        self.num_ctx = num_ctx
+        self.keep_alive = keep_alive
+        self.output = output
+        self.chat_context = ChatContext(num_ctx=num_ctx)
+        self.llm_context = None # /api/generate context, for context_mode "server"
+        self.conversation = Conversation() # what /save writes, same as the GUI's
+        self.filename = f"Untitled-{datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S')}.md"
+
+    def _print(self, text="", end="\n"):
+        self.output.write(text + end)
+        self.output.flush()
+
+    def warm_up(self):
+        '''Load the model in the background, the first answer comes faster.'''
+        def warm():
+            try:
+                self.provider.load(self.model, {"num_ctx": self.num_ctx}, keep_alive=self.keep_alive)
+            except (LLMConnectionError, OSError): # the first prompt reports it
+                pass
+        threading.Thread(target=warm, name="ollamagui-warmup", daemon=True).start()
+
+    #%% Commands
+    def command(self, line):
+        '''Run a /command. Returns False to exit.'''
+        name, _, arg = line[1:].partition(" ")
+        arg = arg.strip()
+        if name in ("quit", "exit", "q"):
+            return False
+        if name == "help":
+            self._print(HELP)
+        elif name == "save":
+            self.save(arg or self.filename)
+        elif name == "model":
+            if arg:
+                self.model = arg
+                self.llm_context = None
+                self.warm_up()
+            self._print(f'Model: {self.model}')
+        elif name == "clear":
+            self.chat_context.clear()
+            self.llm_context = None
+            self.conversation.clear() # /save starts over too
+            self._print('Conversation cleared')
+        else:
+            self._print(f'Unknown command /{name}, try /help')
+        return True
+
+    def save(self, filename):
+        '''Write the transcript, in the same format as the GUI's File->Save.'''
+        try:
+            self.conversation.save(filename)
+        except OSError as e:
+            self._print(f'Could not save file: {e}')
+            return
+        self.filename = filename
+        self._print(f'Saved {os.path.abspath(filename)}')
+
+    #%% Prompts
+    def ask(self, prompt):
+        '''Stream the answer to `prompt`. Ctrl+C stops it, keeping what arrived.'''
+        self.conversation.add("user", prompt)
+        messages = self.chat_context.messages(prompt) if self.context_mode == "chat" else None
+        context = self.llm_context if self.context_mode == "server" else None
+        cancel = CancelToken()
+        result = {}
+        parts = []
+        stream = self.provider.stream(self.model, prompt, messages, {"num_ctx": self.num_ctx}, context,
+                                      keep_alive=self.keep_alive, cancel=cancel, result=result)
+        try:
+            for text in stream:
+                parts.append(text)
+                self._print(text, end="")
+        except KeyboardInterrupt:
+            cancel.cancel()
+            stream.close()
+        except (LLMConnectionError, OSError) as e: # OSError: e.g. the CLI fallback's podman is not installed
+            if parts: # failed halfway through the answer, keep what arrived (like the GUI)
+                self.conversation.add("assistant", "".join(parts), model=self.model)
+            self._print(f'\nOops! Something went wrong!\n{e}')
+            self.conversation.add("text", '\nOops! Something went wrong!\n{}\n'.format(e))
+            return
+        answer = self.conversation.add("assistant", "".join(parts), finished=False, model=self.model)
+        answer.finish(result.get("eval_count"), stopped=cancel.cancelled)
+        self._print(STOPPED if cancel.cancelled else "")
+        self.chat_context.add_exchange(prompt, answer.content, reply_tokens=answer.tokens)
+        if "context" in result:
+            self.llm_context = result["context"]
+
+    def read_prompt(self):
+        '''Read one prompt, lines ending with \\ continue on the next. Raises EOFError at the end of input.'''
+        lines = []
+        while True:
+            line = input("... " if lines else ">>> ")
+            if line.endswith("\\"):
+                lines.append(line[:-1])
+                continue
+            lines.append(line)
+            return "\n".join(lines)
+
+    def run(self):
+        self._print(f'{self.model} via {self.provider.name}. /help for commands, Ctrl+D to exit.')
+        self.warm_up()
+        while True:
+            try:
+                prompt = self.read_prompt()
+            except EOFError:
+                self._print()
+                break
+            except KeyboardInterrupt: # discard the line being typed
+                self._print()
+                continue
+            if not prompt.strip():
+                continue
+            if prompt.startswith("/"):
+                if not self.command(prompt.strip()):
+                    break
+                continue
+            self.ask(prompt)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Chat with an LLM from the terminal.")
+    parser.add_argument("-m", "--model", default="codellama")
+    parser.add_argument("--provider", help="ollama, ollama-http, ollama-cli, openai or mock (default: OLLAMAGUI_PROVIDER)")
+    parser.add_argument("--context", choices=("none", "chat", "server"), default="chat",
+                        help="how earlier turns are remembered (default: chat)")
+    parser.add_argument("--num-ctx", type=int, default=DEFAULT_NUM_CTX, help="context window in tokens")
+    parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Entry point for the terminal chat"""
+    args = parse_args(argv)
+    repl = Repl(make_provider(args.provider), args.model, args.context, args.num_ctx, args.keep_alive)
+    repl.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
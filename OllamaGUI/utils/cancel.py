@@ -0,0 +1,54 @@
+# src/utils/cancel.py
+'''
+Cancellation token shared between the GUI and a running request.
+'''
+
+import threading
+
+
+class CancelToken:
+    """
+    Thread safe "please stop" flag.
+
+    Backends register an abort callback with on_cancel() (close the socket,
+    kill the process...) so a blocked read returns right away instead of at
+    the next token.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e: # aborting is best effort
+                print(f'Cancel callback failed: {e!r}')
+
+    def on_cancel(self, callback):
+        '''Call callback() when cancelled (right away if it already was).'''
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        '''Forget a callback given to on_cancel(), e.g. once its request is over.'''
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout=None):
+        '''Sleep up to timeout seconds, returns True early if cancelled.'''
+        return self._event.wait(timeout)
@@ -0,0 +1,131 @@
+# src/utils/chat_context.py
+'''
+Message history for multi-turn chats (/api/chat), kept within the model's
+context window (num_ctx).
+
+Token counts are estimated from the text length (about 4 characters per token
+for English and code) unless the server reported the real count. Only a
+running total is kept, so adding a message and trimming are O(1) per message.
+'''
+
+import collections
+import itertools
+
+DEFAULT_NUM_CTX = 4096 # tokens, Ollama's default context window
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    '''Cheap token estimate, close enough to budget the context window.'''
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+class ChatContext:
+    """
+    The turns of a conversation that are sent back to the model.
+
+    Parameters
+    ----------
+    num_ctx : int, optional
+        The model's context window in tokens.
+    reserve : float, optional
+        Fraction of num_ctx kept free for the model's reply.
+    system : str, optional
+        System prompt, always sent first and never trimmed.
+    """
+    def __init__(self, num_ctx=DEFAULT_NUM_CTX, reserve=0.25, system=None):
+        self._turns = collections.deque() # (message dict, tokens), oldest first
+        self._total = 0 # tokens in self._turns
+        self.reserve = reserve
+        self.system = system
+        self.num_ctx = num_ctx
+
+    @property
+    def num_ctx(self):
+        return self._num_ctx
+
+    @num_ctx.setter
+    def num_ctx(self, value):
+        self._num_ctx = int(value)
+        self.trim()
+
+    @property
+    def budget(self):
+        '''Tokens available for the system prompt, history and the next prompt.'''
+        return int(self._num_ctx * (1 - self.reserve))
+
+    @property
+    def tokens(self):
+        '''Estimated tokens used by the stored history (excluding the system prompt).'''
+        return self._total
+
+    def __len__(self):
+        return len(self._turns)
+
+    def _system_tokens(self):
+        return estimate_tokens(self.system) if self.system else 0
+
+    def add(self, role, content, tokens=None):
+        '''Append a message, then drop the oldest turns if over budget.'''
+        if tokens is None:
+            tokens = estimate_tokens(content)
+        self._turns.append(({"role": role, "content": content}, tokens))
+        self._total += tokens
+        self.trim()
+
+    def add_exchange(self, prompt, reply, reply_tokens=None):
+        '''Record a completed user prompt and the model's reply.'''
+        self.add("user", prompt)
+        self.add("assistant", reply, reply_tokens)
+
+    def trim(self):
+        '''
+        Drop the oldest messages until the history fits the budget. A user
+        prompt is dropped together with the reply that follows it, so the
+        history never starts with an orphaned assistant message. The newest
+        exchange is always kept.
+        '''
+        budget = self.budget - self._system_tokens()
+        while self._total > budget and len(self._turns) > 2:
+            self._drop_oldest()
+            if self._turns and self._turns[0][0]["role"] == "assistant":
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, tokens = self._turns.popleft()
+        self._total -= tokens
+
+    def clear(self):
+        self._turns.clear()
+        self._total = 0
+
+    def messages(self, prompt=None):
+        '''
+        The message list for /api/chat, optionally ending with a new prompt.
+
+        History that would not leave room for the prompt is left out of this
+        request (newest turns are kept) but is not deleted.
+        '''
+        messages = []
+        available = self.budget - self._system_tokens()
+        if prompt is not None:
+            available -= estimate_tokens(prompt)
+
+        # Walk back from the newest turn until the budget is used up
+        start = len(self._turns)
+        used = 0
+        for message, tokens in reversed(self._turns):
+            if used + tokens > available:
+                break
+            used += tokens
+            start -= 1
+        # don't open with a reply whose prompt was cut off
+        while start < len(self._turns) and self._turns[start][0]["role"] == "assistant":
+            start += 1
+
+        if self.system:
+            messages.append({"role": "system", "content": self.system})
+        messages.extend(dict(message) for message, _ in itertools.islice(self._turns, start, None))
+        if prompt is not None:
+            messages.append({"role": "user", "content": prompt})
+        return messages
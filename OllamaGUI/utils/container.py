@@ -0,0 +1,62 @@
+# src/utils/container.py
+'''
+Thin wrapper around the podman/docker commands that manage the Ollama
+container and, for podman, the VM it runs in.
+'''
+
+import subprocess
+import sys
+
+
+class ContainerControl:
+    """
+    Start, stop and inspect the Ollama container.
+
+    Parameters
+    ----------
+    server_type : str, optional
+        "podman" or "docker".
+    name : str, optional
+        Name of the Ollama container.
+    """
+    def __init__(self, server_type="podman", name="ollama"):
+        self.server_type = server_type
+        self.name = name
+
+    def _run(self, *args, timeout=120):
+        '''Run a container command, returns the CompletedProcess.'''
+        command = [self.server_type, *args]
+        print(command, file=sys.stderr) # not stdout, where batch.py may be writing its results
+        return subprocess.run(command, capture_output=True, timeout=timeout)
+
+    @property
+    def has_machine(self):
+        '''Podman on Windows/macOS runs containers in a VM ("podman machine").'''
+        return self.server_type == "podman"
+
+    def machine_start(self):
+        if not self.has_machine: # docker's daemon is managed by the OS
+            return subprocess.CompletedProcess([], 0, b'', b'')
+        return self._run("machine", "start", timeout=300)
+
+    def machine_stop(self):
+        if not self.has_machine:
+            return subprocess.CompletedProcess([], 0, b'', b'')
+        return self._run("machine", "stop")
+
+    def container_start(self):
+        return self._run("start", self.name)
+
+    def container_stop(self):
+        return self._run("stop", self.name)
+
+    def container_state(self):
+        '''
+        Returns (state, stderr). state is the container's status ("running",
+        "exited", "created"...) or None if it could not be inspected.
+        Raises FileNotFoundError if podman/docker is not installed.
+        '''
+        response = self._run("container", "inspect", self.name, "--format", "{{.State.Status}}", timeout=30)
+        if response.returncode != 0:
+            return None, response.stderr.decode(errors="replace")
+        return response.stdout.decode().strip(), ""
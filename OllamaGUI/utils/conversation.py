@@ -0,0 +1,190 @@
+# src/utils/conversation.py
+'''
+The conversation as data: who said what, when, and how many tokens it took.
+
+A Conversation is the source of truth for a chat. The transcript view renders
+its messages, File->Save writes conversation.to_markdown(), the context sent
+back to the model is built from its exchanges and the metrics read its token
+counts. Nothing needs to read the text back out of a widget.
+
+Transcripts are saved as Markdown, every message under a header line:
+
+    User:
+    the prompt
+
+    Ollama:
+    the answer
+
+from_markdown() reads them back (and any other text, as untitled pages).
+'''
+
+import re
+import time
+
+from .chat_context import estimate_tokens
+
+# Transcript header of each role. "text" messages (an opened file that is not a
+# transcript, error messages...) are shown as they are, without a header.
+HEADERS = {"user": "User", "assistant": "Ollama", "notice": "ANNOUNCMENT"}
+CACHED_HEADER = "Ollama (cached)"
+STOPPED = " [stopped]" # after an answer the user stopped
+
+_HEADER_LINE = re.compile(r"(?:\A|\n)(User|Ollama(?: \(cached\))?|ANNOUNCMENT):\n")
+_ROLES = {header: role for role, header in HEADERS.items()}
+_ROLES[CACHED_HEADER] = "assistant"
+
+
+class Message:
+    """
+    One message. Text is appended piece by piece while it streams in and
+    joined once, when the message is finished.
+
+    Parameters
+    ----------
+    role : str
+        "user", "assistant", "notice" or "text".
+    content : str, optional
+    model : str, optional
+        The model that wrote it, for assistant messages.
+    cached : bool, optional
+        The answer came from the response cache.
+    """
+    __slots__ = ("role", "model", "created", "finished", "tokens", "cached", "stopped", "lines", "_parts")
+
+    def __init__(self, role, content="", model=None, cached=False):
+        self.role = role
+        self.model = model
+        self.created = time.time()
+        self.finished = None # time.time() once complete
+        self.tokens = None # the server's count if it sent one, else an estimate (see finish)
+        self.cached = cached
+        self.stopped = False
+        self._parts = [content] if content else []
+        self.lines = self.header.count("\n") + content.count("\n") # newlines in render()
+
+    @property
+    def header(self):
+        if self.role not in HEADERS:
+            return ""
+        return f'\n{CACHED_HEADER if self.cached else HEADERS[self.role]}:\n'
+
+    @property
+    def footer(self):
+        '''What follows the content once the message is finished.'''
+        if self.finished is None or self.role not in HEADERS:
+            return ""
+        return (STOPPED if self.stopped else "") + "\n"
+
+    @property
+    def content(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def append(self, text):
+        self._parts.append(text)
+        self.lines += text.count("\n")
+
+    def finish(self, tokens=None, stopped=False):
+        '''Mark the message complete. Returns the footer to show after it.'''
+        self.finished = time.time()
+        self.stopped = stopped
+        content = self.content
+        self.tokens = tokens if tokens is not None else estimate_tokens(content)
+        self.lines += self.footer.count("\n")
+        return self.footer
+
+    def render(self):
+        '''The message as it appears in the transcript.'''
+        return self.header + self.content + self.footer
+
+    def __repr__(self):
+        return f'<Message {self.role} {self.tokens or "?"} tokens {self.content[:30]!r}>'
+
+
+class Conversation:
+    """
+    The messages of one chat, oldest first.
+    """
+    def __init__(self, messages=()):
+        self.messages = list(messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    @property
+    def last(self):
+        return self.messages[-1] if self.messages else None
+
+    def index(self, message):
+        '''Position of `message`, None if it is not in this conversation. Fast for recent messages.'''
+        for index in range(len(self.messages) - 1, -1, -1):
+            if self.messages[index] is message:
+                return index
+        return None
+
+    @property
+    def lines(self):
+        return sum(message.lines for message in self.messages)
+
+    @property
+    def tokens(self):
+        '''Tokens in the finished messages.'''
+        return sum(message.tokens for message in self.messages if message.tokens)
+
+    def add(self, role, content="", finished=True, **kwargs):
+        '''Append a new message (finished right away unless told otherwise) and return it.'''
+        message = Message(role, content, **kwargs)
+        if finished:
+            message.finish()
+        self.messages.append(message)
+        return message
+
+    def exchanges(self):
+        '''(prompt, answer) pairs of finished messages, for rebuilding the model's context.'''
+        prompt = None
+        for message in self.messages:
+            if message.role == "user":
+                prompt = message
+            elif message.role == "assistant" and prompt is not None and message.finished is not None:
+                yield prompt, message
+                prompt = None
+
+    def clear(self):
+        self.messages.clear()
+
+    #%% Markdown
+    def to_markdown(self):
+        return "".join(message.render() for message in self.messages)
+
+    def save(self, path):
+        '''Write the transcript to `path` (File->Save, /save in the REPL). Raises OSError.'''
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.to_markdown())
+
+    @classmethod
+    def from_markdown(cls, text, page_lines=100):
+        '''
+        Read a saved transcript. Text before the first header, or a file
+        that is no transcript at all, becomes "text" messages of at most
+        `page_lines` lines each.
+        '''
+        conversation = cls()
+        parts = _HEADER_LINE.split(text) # [preamble, header, body, header, body, ...]
+        lines = parts[0].splitlines(keepends=True)
+        for start in range(0, len(lines), page_lines):
+            conversation.add("text", "".join(lines[start:start + page_lines]))
+        for header, body in zip(parts[1::2], parts[2::2]):
+            body = body[:-1] if body.endswith("\n") else body # the footer's newline
+            stopped = body.endswith(STOPPED)
+            message = Message(_ROLES[header], body[:-len(STOPPED)] if stopped else body,
+                              cached=header == CACHED_HEADER)
+            message.finish(stopped=stopped)
+            conversation.messages.append(message)
+        return conversation
@@ -0,0 +1,13 @@
+# src/utils/errors.py
+'''
+Exceptions shared by the GUI and the LLM backends.
+'''
+
+class LLMConnectionError(Exception):
+    """Raised when the LLM server answers with an error or drops the connection."""
+    pass
+
+
+class LLMUnreachableError(LLMConnectionError):
+    """Raised when the LLM server could not be reached at all (nothing listening)."""
+    pass
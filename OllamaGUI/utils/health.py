@@ -0,0 +1,199 @@
+# src/utils/health.py
+'''
+Cheap health checks for the Ollama server, and bounded attempts to repair it.
+
+Probes never run the model: the provider's ping() (GET /api/version for
+Ollama) tells us the server is up, loaded_models() (/api/ps) which models are
+in memory, and `podman container inspect` why it is down. The last result is
+cached for `ttl` seconds so the GUI can read the status as often as it likes.
+Repairs (starting the VM or container) back off exponentially, with jitter,
+while they keep failing.
+'''
+
+import random
+import subprocess
+import threading
+import time
+
+from .errors import LLMConnectionError, LLMUnreachableError
+
+# Health states
+UNKNOWN = "unknown"
+HEALTHY = "healthy"
+CLI_ONLY = "cli only" # HTTP port closed, prompts go through the fallback (`exec` into the container)
+CONTAINER_STOPPED = "container stopped"
+SERVER_DOWN = "server down" # the API answers with errors
+MACHINE_DOWN = "machine down" # podman VM / container service is not running
+NOT_INSTALLED = "not installed"
+
+DESCRIPTIONS = {
+    UNKNOWN: "Checking server...",
+    HEALTHY: "Server ready",
+    CLI_ONLY: "Server ready (HTTP port closed, using the CLI)",
+    SERVER_DOWN: "Ollama is not answering",
+    CONTAINER_STOPPED: "Ollama container is stopped",
+    MACHINE_DOWN: "Container service is not running",
+    NOT_INSTALLED: "FileNotFoundError\nAre you sure your prefix is set correctly?\nIs Ollama installed?",
+}
+
+
+class HealthMonitor:
+    """
+    Tracks whether the Ollama server is usable and repairs it when possible.
+
+    Thread safe, one instance is shared by every window. check(), repair()
+    and ensure() block (probes, starting the VM...), call them from a worker
+    thread. invalidate() and the attributes never wait, the Tk thread may
+    use them while another window's repair is running.
+
+    Parameters
+    ----------
+    provider : LLMProvider
+    container : ContainerControl, optional
+        Inspected (and started) when the provider can't be reached. None
+        for backends that don't run in a container.
+    ttl : float, optional
+        Seconds a probe result is reused before probing again.
+    base_delay, max_delay : float, optional
+        Backoff between failed repairs starts at base_delay seconds and
+        doubles up to max_delay.
+    """
+    def __init__(self, provider, container=None, ttl=10.0, base_delay=2.0, max_delay=120.0):
+        self.provider = provider
+        self.container = container
+        self.ttl = ttl
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.status = UNKNOWN
+        self.last_error = ""
+        self.version = None
+        self.loaded_models = [] # names from /api/ps
+        self.checked_at = 0.0 # time.monotonic() of the last probe
+
+        self._failures = 0 # consecutive failed repairs
+        self._next_repair = 0.0 # no repair attempts before this time.monotonic()
+        self._lock = threading.RLock() # the probe and the cached state
+        self._repair_lock = threading.Lock() # one repair at a time, held while it runs
+
+    @property
+    def healthy(self):
+        '''True if prompts can be sent, over HTTP or through the CLI.'''
+        return self.status in (HEALTHY, CLI_ONLY)
+
+    @property
+    def description(self):
+        return DESCRIPTIONS.get(self.status, self.status)
+
+    def invalidate(self):
+        '''Forget the cached status, e.g. after a request failed. Never blocks.'''
+        self.checked_at = 0.0 # no lock: a probe in progress may hold it for a while
+
+    def check(self, force=False):
+        '''Return the server status, probing only if the cached one is older than ttl.'''
+        with self._lock:
+            if not force and time.monotonic() - self.checked_at < self.ttl:
+                return self.status
+            self.status, self.last_error = self._probe()
+            self.checked_at = time.monotonic()
+            return self.status
+
+    def _probe(self):
+        try:
+            info = self.provider.ping()
+            self.version = info.get("version")
+            if info.get("fallback"): # only reachable through the fallback (CLI)
+                return CLI_ONLY, ""
+            try:
+                self.loaded_models = self.provider.loaded_models()
+            except LLMConnectionError: # older servers have no /api/ps, not a reason to fail
+                pass
+            return HEALTHY, ""
+        except LLMUnreachableError as e:
+            error = str(e)
+        except LLMConnectionError as e:
+            return SERVER_DOWN, str(e)
+        except FileNotFoundError:
+            return NOT_INSTALLED, ""
+
+        if self.container is None: # nothing we can inspect or start
+            return SERVER_DOWN, error
+
+        # Nothing listening, ask the container engine why
+        try:
+            state, stderr = self.container.container_state()
+        except FileNotFoundError:
+            return NOT_INSTALLED, ""
+        except (OSError, subprocess.SubprocessError) as e: # e.g. timed out
+            return MACHINE_DOWN, str(e)
+
+        if state == "running": # up, but neither the API nor `exec` answers
+            return SERVER_DOWN, error
+        if state is not None:
+            return CONTAINER_STOPPED, f"Container state: {state}"
+        if "socket" in stderr or "connect" in stderr.lower(): # podman machine / docker daemon down
+            return MACHINE_DOWN, stderr
+        return CONTAINER_STOPPED, stderr
+
+    def repair(self):
+        '''
+        Try to bring the server back, unless a previous attempt failed too
+        recently. Returns the new status.
+        '''
+        with self._repair_lock:
+            status = self.check()
+            if status in (HEALTHY, CLI_ONLY, NOT_INSTALLED):
+                return status
+            if self.container is None:
+                return status
+            with self._lock:
+                if time.monotonic() < self._next_repair:
+                    print(f'Not repairing yet, retry in {self._next_repair - time.monotonic():.0f}s') # debug
+                    return status
+
+            # the slow part (up to minutes for the VM), without holding the state lock
+            try:
+                if status == MACHINE_DOWN:
+                    print('Trying to start container service...\n\n')
+                    print(self.container.machine_start().stderr.decode(errors="replace"))
+                    status = CONTAINER_STOPPED
+                if status == CONTAINER_STOPPED:
+                    print('Trying to start Ollama container...\n\n')
+                    print(self.container.container_start().stderr.decode(errors="replace"))
+                if status == SERVER_DOWN: # give a (re)starting server a moment
+                    time.sleep(1.0)
+            except FileNotFoundError:
+                with self._lock:
+                    self.status, self.last_error = NOT_INSTALLED, ""
+                return NOT_INSTALLED
+            except (OSError, subprocess.SubprocessError) as e:
+                with self._lock:
+                    self.last_error = str(e)
+
+            status = self.check(force=True)
+            with self._lock:
+                if self.healthy:
+                    self._failures = 0
+                    self._next_repair = 0.0
+                else:
+                    self._failures += 1
+                    self._next_repair = time.monotonic() + self._backoff()
+            return status
+
+    def _backoff(self):
+        '''Exponential backoff with jitter, so several windows don't retry in lock step.'''
+        delay = min(self.max_delay, self.base_delay * 2 ** (self._failures - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def ensure(self):
+        '''
+        Check the server and repair it if needed.
+
+        Returns (connectionStatus, errorMsg) like the old test_LLM_connection.
+        '''
+        self.check()
+        if not self.healthy:
+            self.repair()
+        if self.healthy:
+            return True, ""
+        return False, f"{self.description}\n{self.last_error}".strip()
@@ -0,0 +1,207 @@
+# src/utils/lifecycle.py
+'''
+Start the container service once and stop it only when nobody needs it.
+
+Every open window (or other session, e.g. a batch run) acquires the service
+and releases it when it closes. The VM/container is stopped once no session
+is left *and* none comes back for `idle_timeout` seconds, so closing the last
+window and opening a new one right away does not pay a full cold start. The
+GUI's grace period is OLLAMAGUI_IDLE_TIMEOUT, see default_idle_timeout().
+
+Sessions are counted across processes too: each process with open sessions
+keeps a heartbeat file in the temp directory, and the service is left running
+while any other process has a fresh one. A machine that is already running
+at launch is reused, never restarted (starting and repairing it is up to
+HealthMonitor.ensure, see utils/health.py).
+
+The idle timer doesn't keep the process alive. If the process exits while it
+is pending (closing the last window ends the GUI), the rest of the wait is
+handed to a detached helper, `python -m utils.lifecycle`, which stops the
+service unless a new session has started by then. If the helper can't be
+started the service is stopped right away.
+'''
+
+import atexit
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SESSION_DIR = os.path.join(tempfile.gettempdir(), "ollamagui-sessions")
+HEARTBEAT_SECONDS = 30.0
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+
+def default_idle_timeout():
+    '''
+    OLLAMAGUI_IDLE_TIMEOUT in seconds, else DEFAULT_IDLE_TIMEOUT. "never"
+    (or a negative number) leaves the container service running.
+    '''
+    value = os.environ.get("OLLAMAGUI_IDLE_TIMEOUT", "").strip().lower()
+    if value in ("never", "none"):
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        return DEFAULT_IDLE_TIMEOUT
+    return None if seconds < 0 else seconds
+
+
+class ContainerLifecycle:
+    """
+    Reference counted owner of the container service.
+
+    Parameters
+    ----------
+    container : ContainerControl
+        None for backends that don't run in a container, nothing is then
+        started or stopped.
+    idle_timeout : float, optional
+        Seconds to wait after the last release before stopping. None never
+        stops, 0 stops right away.
+    stop_machine : bool, optional
+        Stop the podman VM, not just the Ollama container.
+    """
+    def __init__(self, container, idle_timeout=DEFAULT_IDLE_TIMEOUT, stop_machine=True):
+        self.container = container
+        self.idle_timeout = idle_timeout
+        self.stop_machine = stop_machine
+        self._count = 0
+        self._timer = None
+        self._deadline = None # time.monotonic() at which the pending timer fires
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        self._session_file = os.path.join(SESSION_DIR, f"{os.getpid()}.session")
+        atexit.register(self._hand_off)
+
+    @property
+    def sessions(self):
+        '''Sessions open in this process.'''
+        return self._count
+
+    def acquire(self):
+        '''
+        Register a session. Cancels a pending idle shutdown. Does not start
+        anything by itself, see HealthMonitor.ensure.
+        '''
+        with self._lock:
+            self._count += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._count == 1:
+                self._touch()
+                self._start_heartbeat()
+
+    def release(self):
+        '''Unregister a session, and schedule the shutdown if it was the last one.'''
+        with self._lock:
+            self._count = max(0, self._count - 1)
+            if self._count:
+                return
+            self._remove_session_file()
+            if self.idle_timeout is None or self.container is None:
+                return
+            print(f'Container service will stop in {self.idle_timeout:.0f}s unless a new session starts') # debug
+            self._deadline = time.monotonic() + self.idle_timeout
+            self._timer = threading.Timer(self.idle_timeout, self._stop_if_idle)
+            self._timer.daemon = True # see _hand_off() for what happens if the process exits first
+            self._timer.start()
+
+    #%% Shutdown
+    def _hand_off(self):
+        '''At exit: pass a pending idle shutdown on to a detached helper.'''
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            delay = max(0.0, self._deadline - time.monotonic())
+        command = [sys.executable, "-m", "utils.lifecycle", f"{delay:.0f}",
+                   self.container.server_type, self.container.name, "1" if self.stop_machine else "0"]
+        options = {"creationflags": subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP} \
+            if os.name == "nt" else {"start_new_session": True}
+        try:
+            subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             **options)
+        except OSError as e:
+            print(f'Could not start the idle shutdown helper ({e}), stopping now')
+            self._stop_if_idle()
+
+    def _stop_if_idle(self):
+        with self._lock:
+            self._timer = None
+            if self._count:
+                return
+        if self._other_processes_active():
+            print('Another OllamaGUI process is still running, leaving the container service up') # debug
+            return
+        print('Stopping Container Service\n\n')
+        try:
+            if self.stop_machine and self.container.has_machine:
+                self.container.machine_stop() # stops the container with it
+            else:
+                self.container.container_stop()
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f'Could not stop the container service: {e}')
+
+    #%% Cross process session files
+    def _touch(self):
+        try:
+            os.makedirs(SESSION_DIR, exist_ok=True)
+            with open(self._session_file, "a"):
+                pass
+            os.utime(self._session_file)
+        except OSError as e:
+            print(f'Could not write session file: {e}')
+
+    def _remove_session_file(self):
+        try:
+            os.remove(self._session_file)
+        except OSError:
+            pass
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="ollamagui-session", daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self._lock:
+                if not self._count:
+                    self._heartbeat = None
+                    return
+                self._touch()
+
+    def _other_processes_active(self):
+        '''True if another process touched its session file recently. Stale files are cleaned up.'''
+        try:
+            names = os.listdir(SESSION_DIR)
+        except OSError:
+            return False
+        now = time.time()
+        for name in names:
+            path = os.path.join(SESSION_DIR, name)
+            if path == self._session_file:
+                continue
+            try:
+                if now - os.path.getmtime(path) < 3 * HEARTBEAT_SECONDS:
+                    return True
+                os.remove(path) # process crashed or was killed
+            except OSError:
+                pass
+        return False
+
+
+#%% Idle shutdown helper, see ContainerLifecycle._hand_off
+if __name__ == "__main__":
+    from utils.container import ContainerControl
+
+    delay, server_type, name, stop_machine = sys.argv[1:5]
+    time.sleep(float(delay))
+    ContainerLifecycle(ContainerControl(server_type, name), stop_machine=stop_machine == "1")._stop_if_idle()
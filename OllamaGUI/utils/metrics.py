@@ -0,0 +1,170 @@
+# src/utils/metrics.py
+'''
+Per-request performance numbers.
+
+A RequestMetrics follows one prompt through its life: queued in the
+scheduler, sent to the server, first token, done. The server's own counters
+(Ollama's prompt_eval_count, eval_count, eval_duration...) are added from the
+final response. Every finished request is appended as one JSON line to a
+rotating log, so regressions can be charted across models and settings.
+'''
+
+import json
+import logging
+import logging.handlers
+import os
+import time
+
+from .response_cache import default_cache_path
+
+# Fields copied from the final response, durations in nanoseconds as Ollama sends them
+SERVER_FIELDS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+                 "load_duration", "total_duration")
+
+
+def default_log_path():
+    '''metrics.jsonl next to the response cache.'''
+    return os.path.join(os.path.dirname(default_cache_path()), "metrics.jsonl")
+
+
+class RequestMetrics:
+    """
+    Timings of one request. The mark_* methods may be called from any thread,
+    each is only ever called by one.
+
+    Parameters
+    ----------
+    model, provider : str
+    **tags
+        Anything else worth logging (context mode, options...).
+    """
+    def __init__(self, model, provider, **tags):
+        self.model = model
+        self.provider = provider
+        self.tags = tags
+        self.timestamp = time.time()
+        self.queued_at = time.perf_counter()
+        self.started_at = None # got a slot from the scheduler
+        self.first_token_at = None
+        self.finished_at = None
+        self.pieces = 0 # streamed chunks, about one token each
+        self.server = {} # SERVER_FIELDS from the final response
+        self.cached = False
+        self.stopped = False
+        self.error = None
+
+    def mark_started(self):
+        self.started_at = time.perf_counter()
+
+    def mark_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.pieces += 1
+
+    def mark_finished(self, result=None, error=None, stopped=False):
+        self.finished_at = time.perf_counter()
+        result = result or {}
+        self.server = {k: result[k] for k in SERVER_FIELDS if k in result}
+        self.cached = bool(result.get("cached"))
+        self.stopped = stopped
+        self.error = None if error is None else str(error)
+
+    #%% Derived values, in seconds
+    @property
+    def queue_wait(self):
+        return None if self.started_at is None else self.started_at - self.queued_at
+
+    @property
+    def ttft(self):
+        '''From being sent (after any queueing) to the first token.'''
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - (self.started_at or self.queued_at)
+
+    @property
+    def latency(self):
+        '''From send_prompt to the last token, including the queue.'''
+        end = self.finished_at or time.perf_counter()
+        return end - self.queued_at
+
+    @property
+    def tokens(self):
+        return self.server.get("eval_count", self.pieces)
+
+    @property
+    def tokens_per_s(self):
+        '''Generation speed, the server's own if it reported it.'''
+        if self.server.get("eval_duration"):
+            return self.server.get("eval_count", 0) / (self.server["eval_duration"] / 1e9)
+        if self.first_token_at is None or self.tokens < 2:
+            return None
+        end = self.finished_at or time.perf_counter()
+        return (self.tokens - 1) / max(end - self.first_token_at, 1e-9)
+
+    def summary(self):
+        '''Short text for the status bar.'''
+        parts = []
+        if self.cached:
+            parts.append("cached")
+        if self.tokens_per_s is not None:
+            parts.append(f"{self.tokens_per_s:.1f} tok/s")
+        if self.ttft is not None:
+            parts.append(f"first token {self.ttft:.2f} s")
+        parts.append(f"{self.latency:.2f} s total")
+        if self.queue_wait and self.queue_wait >= 0.05:
+            parts.append(f"queued {self.queue_wait:.2f} s")
+        if self.stopped:
+            parts.append("stopped")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        def rounded(value):
+            return None if value is None else round(value, 4)
+        record = {
+            "timestamp": round(self.timestamp, 3), "model": self.model, "provider": self.provider,
+            "queue_wait": rounded(self.queue_wait), "ttft": rounded(self.ttft),
+            "latency": rounded(self.latency), "tokens": self.tokens,
+            "tokens_per_s": rounded(self.tokens_per_s),
+            "cached": self.cached, "stopped": self.stopped, "error": self.error,
+        }
+        record.update(self.server)
+        record.update(self.tags)
+        return record
+
+
+class MetricsLog:
+    """
+    Appends RequestMetrics as JSON lines to a size rotated file
+    (metrics.jsonl, metrics.jsonl.1, ...). Thread safe.
+
+    Parameters
+    ----------
+    path : str, optional
+    max_bytes : int, optional
+        Size at which the file is rotated.
+    backups : int, optional
+        Rotated files kept.
+    """
+    def __init__(self, path=None, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = path or default_log_path()
+        self._handler = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        except OSError as e:
+            print(f'Metrics log disabled: {e}')
+        else:
+            self._handler.setFormatter(logging.Formatter("%(message)s"))
+        # a private logger, records never reach the root logger's handlers
+        self._logger = logging.Logger(f"ollamagui.metrics.{id(self)}")
+        if self._handler is not None:
+            self._logger.addHandler(self._handler)
+
+    def write(self, metrics):
+        if self._handler is not None:
+            self._logger.info(json.dumps(metrics.to_dict(), ensure_ascii=False))
+
+    def close(self):
+        if self._handler is not None:
+            self._handler.close()
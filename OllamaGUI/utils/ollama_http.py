@@ -0,0 +1,325 @@
+# src/utils/ollama_http.py
+'''
+Minimal client for the Ollama REST API (https://github.com/ollama/ollama/blob/main/docs/api.md).
+
+Talking to the server over HTTP avoids spawning a `podman exec ... ollama run`
+process (and a fresh client handshake) for every prompt. Connections are kept
+alive and reused through a small pool, so consecutive prompts share one socket.
+Only the standard library is used.
+
+HTTPJSONClient holds the generic parts (pool, JSON requests, streamed
+NDJSON/server-sent-event responses) and is reused for OpenAI compatible servers.
+'''
+
+import http.client
+import json
+import os
+import queue
+import socket
+
+from .errors import LLMConnectionError, LLMUnreachableError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 11434
+
+# Errors that mean a pooled keep-alive socket was closed by the server
+# while it sat idle. The request is safe to retry once on a new socket.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+def parse_host(value):
+    '''
+    Split an OLLAMA_HOST style string ("host", "host:port" or
+    "http://host:port") into a (host, port) tuple.
+    '''
+    value = value.strip()
+    if "://" in value:
+        value = value.split("://", 1)[1]
+    value = value.rstrip("/")
+    host, _, port = value.rpartition(":")
+    if not host: # no port given
+        return (value or DEFAULT_HOST, DEFAULT_PORT)
+    if host in ("0.0.0.0", ""): # listening on all interfaces, talk to localhost
+        host = DEFAULT_HOST
+    return (host, int(port))
+
+
+class HTTPJSONClient:
+    """
+    Thread safe JSON over HTTP client backed by a pool of keep-alive connections.
+
+    Parameters
+    ----------
+    host, port : str, int
+    timeout : float, optional
+        Read timeout in seconds. None waits as long as the model needs.
+    connect_timeout : float, optional
+        How long to wait for the server to accept the connection.
+    pool_size : int, optional
+        Idle connections kept open for reuse.
+    scheme : str, optional
+        "http" or "https".
+    headers : dict, optional
+        Sent with every request (e.g. Authorization).
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None, connect_timeout=2.0,
+                 pool_size=4, scheme="http", headers=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.scheme = scheme
+        self.headers = dict(headers or {})
+        self._pool = queue.LifoQueue(maxsize=pool_size) # LIFO reuses the warmest socket
+
+    @property
+    def base_url(self):
+        return f"{self.scheme}://{self.host}:{self.port}"
+
+    #%% Connection pool
+    def _new_connection(self):
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.connect_timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        try:
+            conn.connect()
+        except OSError as e: # refused, unreachable, timed out...
+            conn.close()
+            raise LLMUnreachableError(f"Could not connect to {self.base_url}: {e}") from e
+        conn.sock.settimeout(self.timeout)
+        return conn
+
+    def _get_connection(self):
+        try:
+            return self._pool.get_nowait(), True # (connection, reused)
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release_connection(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        '''Close every pooled connection.'''
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    #%% Requests
+    def _send(self, method, path, payload):
+        '''
+        Send a request and return (connection, response) once the headers
+        are in. A pooled socket the server closed while idle is retried once
+        on a fresh connection.
+        '''
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive", **self.headers}
+
+        for attempt in range(2):
+            if attempt == 0:
+                conn, reused = self._get_connection()
+            else: # never retry on another pooled socket, it may be just as stale
+                conn, reused = self._new_connection(), False
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except _STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if reused and attempt == 0: # idle socket was closed by the server, retry on a new one
+                    continue
+                raise LLMConnectionError(f"Connection to {self.base_url} was lost: {e}") from e
+            except OSError as e:
+                conn.close()
+                raise LLMConnectionError(f"Request to {self.base_url}{path} failed: {e}") from e
+
+    def _request(self, method, path, payload=None):
+        '''
+        Send a request and return the decoded JSON body.
+
+        Raises LLMUnreachableError if nothing is listening on the port and
+        LLMConnectionError for HTTP errors or dropped connections.
+        '''
+        conn, response = self._send(method, path, payload)
+        try:
+            data = response.read() # must be fully read before the socket can be reused
+        except OSError as e:
+            conn.close()
+            raise LLMConnectionError(f"Connection to {self.base_url} was lost: {e}") from e
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release_connection(conn)
+
+        if response.status != 200:
+            raise LLMConnectionError(f"HTTP {response.status}: {_error_text(data)}")
+
+        try:
+            return json.loads(data.decode("utf-8")) if data else {}
+        except ValueError as e:
+            raise LLMConnectionError(f"Invalid JSON from {self.base_url}{path}") from e
+
+    def _stream(self, method, path, payload, cancel=None):
+        '''
+        Send a request with "stream": true and yield each JSON object as it
+        arrives, from NDJSON (Ollama) or server-sent events (OpenAI).
+
+        The connection goes back to the pool once the stream is fully
+        consumed, and is closed if the caller stops early. Cancelling the
+        CancelToken `cancel` shuts the socket down, so the server stops
+        generating right away; the generator then simply ends.
+        '''
+        conn, response = self._send(method, path, dict(payload, stream=True))
+
+        if response.status != 200:
+            data = response.read()
+            conn.close()
+            raise LLMConnectionError(f"HTTP {response.status}: {_error_text(data)}")
+
+        def abort():
+            _abort(conn)
+        if cancel is not None:
+            cancel.on_cancel(abort)
+
+        finished = False
+        try:
+            for line in response: # one JSON object per line
+                line = line.strip()
+                if line.startswith(b"data:"): # server-sent event
+                    line = line[5:].strip()
+                    if line == b"[DONE]":
+                        continue
+                if not line or line.startswith((b":", b"event:")):
+                    continue
+                try:
+                    chunk = json.loads(line.decode("utf-8"))
+                except ValueError as e:
+                    raise LLMConnectionError(f"Invalid JSON from {self.base_url}{path}") from e
+                if "error" in chunk:
+                    raise LLMConnectionError(str(chunk["error"]))
+                yield chunk
+            finished = True
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            if cancel is not None and cancel.cancelled: # we closed the socket ourselves
+                return
+            raise LLMConnectionError(f"Connection to {self.base_url} was lost: {e}") from e
+        finally:
+            if cancel is not None: # before checking `cancelled`, so a late cancel can't abort a pooled connection
+                cancel.remove_callback(abort)
+            if finished and not response.will_close and not (cancel is not None and cancel.cancelled):
+                self._release_connection(conn)
+            else: # abandoned, cancelled or broken mid stream, the socket can't be reused
+                conn.close()
+
+    def is_reachable(self):
+        '''Return True if something is listening on the port.'''
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.connect_timeout):
+                return True
+        except OSError:
+            return False
+
+
+class OllamaHTTPClient(HTTPJSONClient):
+    """
+    Thread safe Ollama REST client backed by a pool of keep-alive connections.
+    """
+    @classmethod
+    def from_env(cls, **kwargs):
+        '''Build a client from the OLLAMA_HOST environment variable, if set.'''
+        host, port = parse_host(os.environ.get("OLLAMA_HOST", f"{DEFAULT_HOST}:{DEFAULT_PORT}"))
+        return cls(host, port, **kwargs)
+
+    def version(self):
+        return self._request("GET", "/api/version")
+
+    def loaded_models(self):
+        '''Models currently in memory (/api/ps).'''
+        return self._request("GET", "/api/ps").get("models", [])
+
+    def list_models(self):
+        '''Models available on the server (/api/tags).'''
+        return self._request("GET", "/api/tags").get("models", [])
+
+    def generate(self, model, prompt, options=None, **kwargs):
+        '''
+        Single prompt completion via /api/generate.
+
+        Returns the full response dict, the completion text is in ["response"].
+        Extra keyword arguments (context, keep_alive, system...) are passed
+        through to the API unchanged.
+        '''
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        payload.update(kwargs)
+        return self._request("POST", "/api/generate", payload)
+
+    def chat(self, model, messages, options=None, **kwargs):
+        '''
+        Multi message completion via /api/chat.
+
+        `messages` is a list of {"role": ..., "content": ...} dicts. Returns the
+        full response dict, the completion text is in ["message"]["content"].
+        '''
+        payload = {"model": model, "messages": messages, "stream": False}
+        if options:
+            payload["options"] = options
+        payload.update(kwargs)
+        return self._request("POST", "/api/chat", payload)
+
+    def generate_stream(self, model, prompt, options=None, cancel=None, **kwargs):
+        '''
+        Streaming version of generate(). Yields the partial response dicts,
+        the new text of each one is in ["response"] and the last one has
+        "done": True along with the timing fields and "context".
+        '''
+        payload = {"model": model, "prompt": prompt}
+        if options:
+            payload["options"] = options
+        payload.update(kwargs)
+        return self._stream("POST", "/api/generate", payload, cancel)
+
+    def chat_stream(self, model, messages, options=None, cancel=None, **kwargs):
+        '''
+        Streaming version of chat(). Yields the partial response dicts, the
+        new text of each one is in ["message"]["content"].
+        '''
+        payload = {"model": model, "messages": messages}
+        if options:
+            payload["options"] = options
+        payload.update(kwargs)
+        return self._stream("POST", "/api/chat", payload, cancel)
+
+
+def _abort(conn):
+    '''Shut a connection's socket down from another thread, unblocking its reader.'''
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _error_text(data):
+    '''Pull the "error" field out of an error body, if there is one.'''
+    text = data.decode("utf-8", errors="replace")
+    try:
+        error = json.loads(text).get("error", text)
+    except (ValueError, AttributeError):
+        return text
+    if isinstance(error, dict): # OpenAI style {"error": {"message": ...}}
+        return error.get("message", str(error))
+    return error
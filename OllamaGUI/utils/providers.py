@@ -0,0 +1,520 @@
+# src/utils/providers.py
+'''
+LLM backends behind one interface.
+
+Every provider can stream a completion (cancellably), return it in one piece,
+list its models, report its health and preload a model. The GUI, the batch
+runner and the benchmarks only talk to this interface, so they run the same
+against Ollama over HTTP, the Ollama CLI inside a container, any OpenAI
+compatible server (llama.cpp, vLLM, LM Studio...) or the in-process mock.
+
+Pick one with make_provider() or the OLLAMAGUI_PROVIDER environment variable.
+'''
+
+import codecs
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.parse
+
+from .container import ContainerControl
+from .errors import LLMConnectionError, LLMUnreachableError
+from .ollama_http import HTTPJSONClient, OllamaHTTPClient
+
+
+class LLMProvider:
+    """
+    Interface shared by every backend. Providers hold no per-request state,
+    one instance can serve several windows and threads at once.
+
+    Request parameters used throughout:
+
+    model : str
+    prompt : str, optional
+        The new user prompt. Ignored if `messages` is given.
+    messages : list of dict, optional
+        Whole conversation as {"role", "content"} dicts, ending with the prompt.
+    options : dict, optional
+        Ollama style model options (num_ctx, temperature, seed...).
+    context : list of int, optional
+        Ollama /api/generate context from the previous response.
+    keep_alive : str or int, optional
+        How long the server should keep the model loaded afterwards.
+    cancel : CancelToken, optional
+        Cancelling it aborts the request, the stream then just ends.
+    result : dict, optional
+        Updated with the final response fields (context, eval_count, timings...).
+    """
+    name = "provider"
+    container = None # ContainerControl, for backends hosted in a container
+
+    def stream(self, model, prompt=None, messages=None, options=None, context=None,
+               keep_alive=None, cancel=None, result=None):
+        '''Yield the response text piece by piece as it is generated.'''
+        raise NotImplementedError
+
+    def generate(self, model, prompt=None, messages=None, options=None, context=None,
+                 keep_alive=None, cancel=None, result=None):
+        '''Return the whole response text.'''
+        return "".join(self.stream(model, prompt, messages, options, context, keep_alive, cancel, result))
+
+    def ping(self):
+        '''
+        Cheapest possible "are you there", never runs a model. Returns a dict
+        of server info, raises LLMUnreachableError if nothing answers and
+        LLMConnectionError if the server answers with an error.
+        '''
+        raise NotImplementedError
+
+    def health(self):
+        '''Returns (ok, errorMsg).'''
+        try:
+            self.ping()
+        except LLMConnectionError as e:
+            return False, str(e)
+        return True, ""
+
+    def list_models(self):
+        '''Names of the models the backend can serve.'''
+        return []
+
+    def loaded_models(self):
+        '''Names of the models currently in memory, if the backend can tell.'''
+        return []
+
+    def model_digest(self, model):
+        '''
+        Identifies the exact weights behind `model`, changes when the model is
+        re-pulled. Backends that can't tell fall back to the name.
+        '''
+        return f"{self.name}:{model}"
+
+    def load(self, model, options=None, keep_alive=None):
+        '''Preload a model so the first prompt doesn't pay for loading it.'''
+        pass
+
+    @staticmethod
+    def _last_prompt(prompt, messages):
+        '''The prompt for backends without a chat endpoint.'''
+        if messages:
+            for message in reversed(messages):
+                if message.get("role") == "user":
+                    return message.get("content", "")
+        return prompt or ""
+
+
+#%% Ollama
+class OllamaHTTPProvider(LLMProvider):
+    """Ollama's REST API over a pooled keep-alive connection."""
+    name = "ollama-http"
+
+    DIGEST_TTL = 60.0 # seconds a looked up digest is trusted
+
+    def __init__(self, client=None):
+        self.client = client or OllamaHTTPClient.from_env()
+        self._digests = {} # model -> (digest, time looked up)
+
+    def _extras(self, context, keep_alive):
+        extras = {}
+        if keep_alive is not None:
+            extras["keep_alive"] = keep_alive
+        if context is not None:
+            extras["context"] = context
+        return extras
+
+    def stream(self, model, prompt=None, messages=None, options=None, context=None,
+               keep_alive=None, cancel=None, result=None):
+        if messages is None:
+            chunks = self.client.generate_stream(model, prompt, options, cancel, **self._extras(context, keep_alive))
+        else:
+            chunks = self.client.chat_stream(model, messages, options, cancel, **self._extras(None, keep_alive))
+        for chunk in chunks:
+            if chunk.get("done") and result is not None:
+                result.update(chunk)
+            if messages is None:
+                yield chunk.get("response", "")
+            else:
+                yield chunk.get("message", {}).get("content", "")
+
+    def generate(self, model, prompt=None, messages=None, options=None, context=None,
+                 keep_alive=None, cancel=None, result=None):
+        if cancel is not None: # only a stream can be aborted half way
+            return super().generate(model, prompt, messages, options, context, keep_alive, cancel, result)
+        if messages is None:
+            reply = self.client.generate(model, prompt, options, **self._extras(context, keep_alive))
+            text = reply.get("response", "")
+        else:
+            reply = self.client.chat(model, messages, options, **self._extras(None, keep_alive))
+            text = reply.get("message", {}).get("content", "")
+        if result is not None:
+            result.update(reply)
+        return text
+
+    def ping(self):
+        return self.client.version()
+
+    def list_models(self):
+        return [m.get("name") for m in self.client.list_models()]
+
+    def loaded_models(self):
+        return [m.get("name") for m in self.client.loaded_models()]
+
+    def model_digest(self, model):
+        digest, when = self._digests.get(model, (None, 0.0))
+        if digest is None or time.monotonic() - when > self.DIGEST_TTL:
+            names = (model, model + ":latest")
+            digest = next((m.get("digest") for m in self.client.list_models() if m.get("name") in names), None)
+            digest = digest or super().model_digest(model)
+            self._digests[model] = (digest, time.monotonic())
+        return digest
+
+    def load(self, model, options=None, keep_alive=None):
+        # an empty prompt loads the model without generating anything
+        return self.client.generate(model, "", options, **self._extras(None, keep_alive))
+
+
+class OllamaCLIProvider(LLMProvider):
+    """
+    `ollama run` inside the container (`podman exec ollama ollama run ...`).
+
+    Only single prompts are supported, the CLI has no chat history or
+    context. `prefix` replaces the command in front of "<model> <prompt>"
+    (e.g. to run a local `ollama` binary or a test stub).
+    """
+    name = "ollama-cli"
+
+    def __init__(self, container=None, prefix=None):
+        if container is None and prefix is None:
+            container = ContainerControl()
+        self.container = container
+        self._prefix = prefix
+
+    @property
+    def prefix(self):
+        if self._prefix is not None:
+            return list(self._prefix)
+        return [self.container.server_type, "exec", self.container.name, "ollama"]
+
+    def stream(self, model, prompt=None, messages=None, options=None, context=None,
+               keep_alive=None, cancel=None, result=None):
+        command = self.prefix + ["run", model, self._last_prompt(prompt, messages)]
+
+        # own process group, so cancelling also kills anything the command started
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   start_new_session=(os.name == "posix"))
+        if cancel is not None:
+            cancel.on_cancel(lambda: _kill(process))
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace') # tokens may split multi-byte characters
+        try:
+            while True:
+                data = process.stdout.read1(4096) # whatever is available, without waiting to fill the buffer
+                if not data:
+                    break
+                yield decoder.decode(data)
+            yield decoder.decode(b'', final=True)
+
+            stderr = process.stderr.read().decode(errors='replace')
+            if cancel is not None and cancel.cancelled: # killed on purpose
+                return
+            if process.wait() != 0:
+                raise LLMConnectionError('Error Code: {}\n{}'.format(process.returncode, stderr))
+            if result is not None:
+                result.update({"model": model, "done": True})
+        finally:
+            if process.poll() is None: # caller stopped early
+                _kill(process)
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+    def ping(self):
+        if self.container is None:
+            return {}
+        try:
+            state, stderr = self.container.container_state()
+        except (OSError, subprocess.SubprocessError) as e:
+            raise LLMUnreachableError(f"Could not inspect the container: {e}") from e
+        if state != "running":
+            raise LLMUnreachableError(stderr or f"Container state: {state}")
+        return {"state": state}
+
+    def list_models(self):
+        response = subprocess.run(self.prefix + ["list"], capture_output=True)
+        if response.returncode != 0:
+            raise LLMConnectionError(response.stderr.decode(errors='replace'))
+        lines = response.stdout.decode(errors='replace').splitlines()[1:] # skip the header
+        return [line.split()[0] for line in lines if line.strip()]
+
+    def model_digest(self, model):
+        '''The ID column of `ollama list`, a prefix of the digest.'''
+        try:
+            response = subprocess.run(self.prefix + ["list"], capture_output=True, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            return super().model_digest(model)
+        names = (model, model + ":latest")
+        for line in response.stdout.decode(errors='replace').splitlines()[1:]:
+            fields = line.split()
+            if len(fields) > 1 and fields[0] in names:
+                return fields[1]
+        return super().model_digest(model)
+
+
+def _kill(process):
+    '''Kill a process started by OllamaCLIProvider, and its children on POSIX.'''
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError: # already gone
+        pass
+
+
+#%% OpenAI compatible (llama.cpp server, vLLM, LM Studio, ...)
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Any server implementing the OpenAI /v1/chat/completions API.
+
+    Parameters
+    ----------
+    base_url : str, optional
+        Up to and including the version, e.g. "http://127.0.0.1:8080/v1".
+    api_key : str, optional
+        Sent as a Bearer token.
+    """
+    name = "openai"
+
+    # Ollama option names -> OpenAI request fields
+    OPTION_NAMES = {"temperature": "temperature", "top_p": "top_p", "seed": "seed",
+                    "num_predict": "max_tokens", "stop": "stop"}
+
+    def __init__(self, base_url="http://127.0.0.1:8080/v1", api_key=None, **client_kwargs):
+        url = urllib.parse.urlsplit(base_url)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = HTTPJSONClient(url.hostname, port, scheme=url.scheme, headers=headers, **client_kwargs)
+        self.path = url.path.rstrip("/")
+
+    def _payload(self, model, prompt, messages, options):
+        payload = {"model": model, "messages": messages or [{"role": "user", "content": prompt or ""}]}
+        for name, value in (options or {}).items():
+            if name in self.OPTION_NAMES:
+                payload[self.OPTION_NAMES[name]] = value
+        return payload
+
+    def stream(self, model, prompt=None, messages=None, options=None, context=None,
+               keep_alive=None, cancel=None, result=None):
+        payload = self._payload(model, prompt, messages, options)
+        payload["stream_options"] = {"include_usage": True} # token counts in the last chunk
+        for chunk in self.client._stream("POST", self.path + "/chat/completions", payload, cancel):
+            if chunk.get("usage") and result is not None:
+                result.update(_openai_usage(chunk))
+            for choice in chunk.get("choices", []):
+                text = choice.get("delta", {}).get("content")
+                if text:
+                    yield text
+        if result is not None:
+            result.update({"model": model, "done": True})
+
+    def generate(self, model, prompt=None, messages=None, options=None, context=None,
+                 keep_alive=None, cancel=None, result=None):
+        if cancel is not None:
+            return super().generate(model, prompt, messages, options, context, keep_alive, cancel, result)
+        payload = dict(self._payload(model, prompt, messages, options), stream=False)
+        reply = self.client._request("POST", self.path + "/chat/completions", payload)
+        if result is not None:
+            result.update(_openai_usage(reply), model=model, done=True)
+        choices = reply.get("choices") or [{}]
+        return choices[0].get("message", {}).get("content", "")
+
+    def ping(self):
+        return self.client._request("GET", self.path + "/models")
+
+    def list_models(self):
+        return [m.get("id") for m in self.ping().get("data", [])]
+
+
+def _openai_usage(reply):
+    '''OpenAI token usage under the Ollama field names.'''
+    usage = reply.get("usage") or {}
+    return {"prompt_eval_count": usage.get("prompt_tokens", 0), "eval_count": usage.get("completion_tokens", 0)}
+
+
+#%% Test double
+class MockProvider(LLMProvider):
+    """
+    Deterministic in-process backend for tests, demos and benchmarks.
+
+    The reply echoes the prompt, word by word, unless `reply` is given (a
+    string or a function of the prompt). Delays simulate a real model.
+
+    Parameters
+    ----------
+    reply : str or callable, optional
+    ttft : float, optional
+        Seconds before the first token.
+    token_delay : float, optional
+        Seconds between tokens.
+    load_delay : float, optional
+        Seconds load() takes, simulating a cold model.
+    models : sequence of str, optional
+    """
+    name = "mock"
+
+    def __init__(self, reply=None, ttft=0.0, token_delay=0.0, load_delay=0.0, models=("mock",)):
+        self.reply = reply
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.load_delay = load_delay
+        self.models = list(models)
+
+    def _reply_for(self, prompt):
+        if callable(self.reply):
+            return self.reply(prompt)
+        if self.reply is not None:
+            return self.reply
+        return f"Mock reply to: {prompt.strip()}"
+
+    @staticmethod
+    def _sleep(seconds, cancel):
+        '''Sleep, returning True early if cancelled.'''
+        if cancel is not None:
+            return cancel.wait(seconds)
+        if seconds:
+            time.sleep(seconds)
+        return False
+
+    def stream(self, model, prompt=None, messages=None, options=None, context=None,
+               keep_alive=None, cancel=None, result=None):
+        prompt = self._last_prompt(prompt, messages)
+        words = self._reply_for(prompt).split(" ")
+        start = time.perf_counter()
+        if self._sleep(self.ttft, cancel):
+            return
+        for i, word in enumerate(words):
+            if i and self._sleep(self.token_delay, cancel):
+                return
+            yield word if i == 0 else " " + word
+
+        if result is not None:
+            duration = int((time.perf_counter() - start) * 1e9)
+            prompt_tokens = len(prompt.split())
+            result.update({
+                "model": model, "done": True,
+                "prompt_eval_count": prompt_tokens, "eval_count": len(words),
+                "total_duration": duration, "eval_duration": duration,
+                "context": list(context or []) + list(range(prompt_tokens + len(words))),
+            })
+
+    def ping(self):
+        return {"version": "mock"}
+
+    def list_models(self):
+        return list(self.models)
+
+    def loaded_models(self):
+        return list(self.models)
+
+    def load(self, model, options=None, keep_alive=None):
+        time.sleep(self.load_delay)
+        return {"model": model, "done": True}
+
+
+#%% Fallback
+class FallbackProvider(LLMProvider):
+    """
+    Use `primary`, and `fallback` only when the primary can't be reached at
+    all (e.g. Ollama's HTTP port is closed but `podman exec` works).
+    """
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    @property
+    def container(self):
+        return self.primary.container or self.fallback.container
+
+    def stream(self, model, prompt=None, messages=None, options=None, context=None,
+               keep_alive=None, cancel=None, result=None):
+        started = False
+        try:
+            for text in self.primary.stream(model, prompt, messages, options, context, keep_alive, cancel, result):
+                started = True
+                yield text
+            return
+        except LLMUnreachableError as e:
+            if started:
+                raise
+            print(f'{e}\nFalling back to {self.fallback.name}', file=sys.stderr) # stdout may be batch.py's results
+        yield from self.fallback.stream(model, prompt, messages, options, context, keep_alive, cancel, result)
+
+    def generate(self, model, prompt=None, messages=None, options=None, context=None,
+                 keep_alive=None, cancel=None, result=None):
+        try:
+            return self.primary.generate(model, prompt, messages, options, context, keep_alive, cancel, result)
+        except LLMUnreachableError as e:
+            print(f'{e}\nFalling back to {self.fallback.name}', file=sys.stderr) # stdout may be batch.py's results
+        return self.fallback.generate(model, prompt, messages, options, context, keep_alive, cancel, result)
+
+    def ping(self):
+        '''Primary's info, or the fallback's marked with "fallback" if only that one answers.'''
+        try:
+            return self.primary.ping()
+        except LLMUnreachableError as primary_error:
+            try:
+                info = dict(self.fallback.ping())
+            except LLMConnectionError:
+                raise primary_error
+            info["fallback"] = self.fallback.name
+            return info
+
+    def list_models(self):
+        try:
+            return self.primary.list_models()
+        except LLMUnreachableError:
+            return self.fallback.list_models()
+
+    def loaded_models(self):
+        try:
+            return self.primary.loaded_models()
+        except LLMUnreachableError:
+            return self.fallback.loaded_models()
+
+    def model_digest(self, model):
+        try:
+            return self.primary.model_digest(model)
+        except LLMUnreachableError:
+            return self.fallback.model_digest(model)
+
+    def load(self, model, options=None, keep_alive=None):
+        return self.primary.load(model, options, keep_alive)
+
+
+#%% Factory
+def make_provider(name=None):
+    '''
+    Build a provider by name, default from the OLLAMAGUI_PROVIDER environment
+    variable:
+
+    "ollama" (default) : HTTP API, falling back to the CLI in the container
+    "ollama-http" : HTTP API only (OLLAMA_HOST)
+    "ollama-cli" : `podman exec ollama ollama run` only
+    "openai" : OpenAI compatible server (OPENAI_BASE_URL, OPENAI_API_KEY)
+    "mock" : in-process test double, no server needed
+    '''
+    name = (name or os.environ.get("OLLAMAGUI_PROVIDER", "ollama")).lower()
+    if name == "ollama":
+        return FallbackProvider(OllamaHTTPProvider(), OllamaCLIProvider(ContainerControl()))
+    if name == "ollama-http":
+        return OllamaHTTPProvider()
+    if name == "ollama-cli":
+        return OllamaCLIProvider(ContainerControl())
+    if name == "openai":
+        return OpenAICompatibleProvider(os.environ.get("OPENAI_BASE_URL", "http://127.0.0.1:8080/v1"),
+                                        os.environ.get("OPENAI_API_KEY"))
+    if name == "mock":
+        return MockProvider(token_delay=0.02)
+    raise ValueError(f"Unknown provider {name!r}")
@@ -0,0 +1,155 @@
+# src/utils/response_cache.py
+'''
+Cache of model responses for deterministic requests.
+
+A response can only be reused if the model would produce it again, i.e. the
+request pins temperature to 0 or sets a seed. The key is a hash of the
+model's digest (so re-pulling a model invalidates its entries), the model
+options and the full message list / context.
+
+Two tiers: a small in-memory LRU for the current session, and SQLite on disk
+that survives restarts and is trimmed to `max_bytes`, least recently used first.
+'''
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def default_cache_path():
+    '''responses.sqlite3 in the user's cache directory.'''
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "ollamagui", "responses.sqlite3")
+
+
+def is_deterministic(options):
+    '''True if the options make the model's output repeatable.'''
+    options = options or {}
+    return options.get("temperature") == 0 or "seed" in options
+
+
+def make_key(model_digest, options, messages, context=None):
+    '''Hash identifying a request. Dict ordering does not matter.'''
+    request = {"model": model_digest, "options": options or {}, "messages": messages, "context": context}
+    data = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two tier (memory + SQLite) LRU cache of responses. Thread safe.
+
+    Parameters
+    ----------
+    path : str, optional
+        SQLite file. None keeps the cache in memory only.
+    memory_items : int, optional
+        Entries kept in the in-memory tier.
+    max_bytes : int, optional
+        Size limit of the on-disk tier.
+    """
+    def __init__(self, path=None, memory_items=256, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict() # key -> (response, meta), most recent last
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path):
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False) # all access goes through self._lock
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL, meta TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._db.commit()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        except sqlite3.Error as e: # unwritable cache dir etc., run with the memory tier only
+            print(f'Response cache disabled on disk: {e}')
+            self._db = None
+
+    def get(self, key):
+        '''Returns (response, meta) or None.'''
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT response, meta FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    entry = (row[0], json.loads(row[1]))
+                    self._remember(key, entry)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, response, meta=None):
+        entry = (response, dict(meta or {}))
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is None:
+                return
+            meta_json = json.dumps(entry[1])
+            size = len(response.encode("utf-8")) + len(meta_json)
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, meta, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, meta_json, size, time.time()),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    #%% Internals, called with self._lock held
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        '''Delete least recently used rows until the disk tier fits max_bytes.'''
+        while self._disk_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= self.max_bytes:
+                    return
@@ -0,0 +1,182 @@
+# src/utils/scheduler.py
+'''
+Process wide queue in front of the LLM server.
+
+Every window asks the scheduler for a slot before sending a generation
+request. At most `max_concurrent` requests run at once,
+matching the server's OLLAMA_NUM_PARALLEL, so extra requests wait here in
+order instead of piling up on the server and slowing every one of them down.
+
+Waiting requests are served by priority, first come first served within a
+priority: the window the user is typing in goes ahead of background windows.
+batch.py runs in its own process and limits itself with --workers.
+'''
+
+import contextlib
+import itertools
+import os
+import threading
+
+FOREGROUND = 0 # the window with keyboard focus
+BACKGROUND = 1 # other windows
+
+
+def default_max_concurrent():
+    '''OLLAMAGUI_MAX_CONCURRENT, else the server's OLLAMA_NUM_PARALLEL, else 1.'''
+    for name in ("OLLAMAGUI_MAX_CONCURRENT", "OLLAMA_NUM_PARALLEL"):
+        try:
+            value = int(os.environ.get(name, ""))
+        except ValueError:
+            continue
+        if value > 0:
+            return value
+    return 1
+
+
+class Ticket:
+    """
+    A request's place in the queue.
+
+    `priority` is an int or a function returning one, read whenever the
+    scheduler picks the next request (so a window that gains focus moves up).
+    `on_position(n)` is called from whichever thread changed the queue with
+    the number of requests ahead, and with 0 once the request may start.
+    """
+    def __init__(self, priority, seq, on_position=None):
+        self._priority = priority
+        self.seq = seq
+        self.on_position = on_position
+        self.granted = False
+        self.position = None
+
+    @property
+    def priority(self):
+        return self._priority() if callable(self._priority) else self._priority
+
+    def _sort_key(self):
+        return (self.priority, self.seq)
+
+
+class RequestScheduler:
+    """
+    Concurrency limit plus priority FIFO queue. Thread safe.
+
+    Parameters
+    ----------
+    max_concurrent : int, optional
+        Requests allowed to run at once.
+    """
+    def __init__(self, max_concurrent=None):
+        self._max_concurrent = max_concurrent or default_max_concurrent()
+        self._running = 0
+        self._waiting = [] # Tickets, in no particular order
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def max_concurrent(self):
+        return self._max_concurrent
+
+    @max_concurrent.setter
+    def max_concurrent(self, value):
+        with self._cond:
+            self._max_concurrent = max(1, int(value))
+            changed = self._dispatch()
+        self._notify(changed)
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    @contextlib.contextmanager
+    def slot(self, priority=FOREGROUND, cancel=None, on_position=None):
+        '''
+        Hold a slot for the duration of the with block. Blocks until one is
+        free. Yields True, or False if the CancelToken `cancel` was cancelled
+        while waiting (the request should then not be sent).
+        '''
+        ticket = self.acquire(priority, cancel, on_position)
+        try:
+            yield ticket is not None
+        finally:
+            if ticket is not None:
+                self.release()
+
+    def acquire(self, priority=FOREGROUND, cancel=None, on_position=None):
+        '''Wait for a slot. Returns the granted Ticket, or None if cancelled first.'''
+        with self._cond:
+            ticket = Ticket(priority, next(self._seq), on_position)
+            self._waiting.append(ticket)
+            changed = self._dispatch()
+        self._notify(changed)
+
+        if cancel is not None and not ticket.granted:
+            cancel.on_cancel(self._wake_all)
+        try:
+            with self._cond:
+                while not ticket.granted and not (cancel is not None and cancel.cancelled):
+                    self._cond.wait()
+                if ticket.granted:
+                    return ticket
+                self._waiting.remove(ticket) # cancelled while waiting
+                changed = self._dispatch()
+        finally:
+            if cancel is not None:
+                cancel.remove_callback(self._wake_all)
+        self._notify(changed)
+        return None
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            changed = self._dispatch()
+        self._notify(changed)
+
+    #%% Internals
+    def _wake_all(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _dispatch(self):
+        '''
+        Start waiting requests while slots are free and recompute the queue
+        positions. Called with the lock held, returns the tickets whose
+        position changed so they can be told after the lock is released.
+        '''
+        changed = []
+        self._waiting.sort(key=Ticket._sort_key)
+        while self._waiting and self._running < self._max_concurrent:
+            ticket = self._waiting.pop(0)
+            ticket.granted = True
+            ticket.position = 0
+            changed.append(ticket)
+            self._running += 1
+        self._cond.notify_all()
+
+        for position, ticket in enumerate(self._waiting, start=1):
+            if ticket.position != position:
+                ticket.position = position
+                changed.append(ticket)
+        return changed
+
+    def _notify(self, tickets):
+        for ticket in tickets:
+            if ticket.on_position is not None:
+                ticket.on_position(ticket.position)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def shared_scheduler():
+    '''The scheduler shared by every window of this process.'''
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
@@ -0,0 +1,109 @@
+# src/utils/search.py
+'''
+Find in a conversation without scanning all of it.
+
+SearchIndex keeps an inverted index from words to the messages containing
+them, updated as messages are finished. A query is looked up word by word
+(the words of the query are prefixes, so results show up while typing), and
+only the messages that contain all of them are searched for the exact text.
+Messages not indexed yet (still streaming in, or not reached by update(),
+which can work through a long transcript a chunk at a time) are always searched.
+
+Matches are case-insensitive and start at the beginning of a word, like "pars"
+in "parser" (not "arser"), so they are the same whether a message was found
+through the index or not. Queries without any letters or digits, like "==",
+fall back to searching every message.
+'''
+
+import array
+import bisect
+import re
+
+_WORD = re.compile(r"\w+")
+_WORD_CHAR = re.compile(r"\w")
+
+
+class SearchIndex:
+    """
+    Word index of a Conversation's finished messages.
+
+    Parameters
+    ----------
+    conversation : Conversation
+    """
+    def __init__(self, conversation):
+        self.conversation = conversation
+        self._postings = {} # word -> array of message indices, ascending
+        self._indexed = 0 # messages[:_indexed] are in the index
+        self._vocabulary = [] # sorted words, for prefix lookups
+        self._vocabulary_dirty = False
+
+    def update(self, max_lines=None):
+        '''
+        Index the messages finished since the last call, or about `max_lines`
+        lines of them. Returns True if none are left. Cheap if there are none.
+        '''
+        messages = self.conversation.messages
+        lines = 0
+        while self._indexed < len(messages) and messages[self._indexed].finished is not None:
+            if max_lines is not None and lines >= max_lines:
+                return False
+            lines += messages[self._indexed].lines
+            for word in set(_WORD.findall(messages[self._indexed].render().lower())):
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = array.array("I")
+                    self._vocabulary_dirty = True
+                postings.append(self._indexed)
+            self._indexed += 1
+        return True
+
+    def _messages_with_prefix(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        found = set()
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            found.update(self._postings[self._vocabulary[position]])
+            position += 1
+        return found
+
+    def candidates(self, query):
+        '''Indices of the messages that may contain `query`, ascending.'''
+        words = _WORD.findall(query.lower())
+        if not words:
+            return range(len(self.conversation))
+        found = None
+        for word in sorted(words, key=len, reverse=True): # the longest word is usually the rarest
+            messages = self._messages_with_prefix(word)
+            found = messages if found is None else found & messages
+            if not found:
+                break
+        return sorted(found) + list(range(self._indexed, len(self.conversation)))
+
+    def find(self, query):
+        '''
+        Every match of `query`, as (message index, start, end) with the
+        offsets in the message's render(), in transcript order.
+        '''
+        if not query:
+            return []
+        word_start = _WORD_CHAR.match(query) is not None # then the match must not follow a letter
+        pattern = re.compile((r"(?<!\w)" if word_start else "") + re.escape(query), re.IGNORECASE)
+        needle = query.lower()
+        hits = []
+        for index in self.candidates(query):
+            text = self.conversation[index].render()
+            lowered = text.lower()
+            if len(lowered) != len(text) or len(needle) != len(query): # e.g. "İ", offsets would shift
+                hits.extend((index, match.start(), match.end()) for match in pattern.finditer(text))
+                continue
+            start = lowered.find(needle) # much faster than the regex
+            while start >= 0:
+                if not (word_start and start and _WORD_CHAR.match(lowered, start - 1)):
+                    hits.append((index, start, start + len(needle)))
+                    start = lowered.find(needle, start + len(needle))
+                else:
+                    start = lowered.find(needle, start + 1)
+        return hits
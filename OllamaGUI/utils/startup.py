@@ -0,0 +1,44 @@
+# src/utils/startup.py
+'''
+Cold start timing.
+
+main.py marks each startup phase (imports done, widgets built, first paint,
+backend ready) and prints a one line report once the model is ready. Set
+OLLAMAGUI_STARTUP_BUDGET_MS to get a warning whenever the window takes
+longer than that to paint.
+
+Kept free of heavy imports, it is loaded before anything else.
+'''
+
+import os
+import time
+
+
+class StartupTimer:
+    """
+    Milliseconds from `t0` (a time.perf_counter() value) to each phase.
+    """
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.marks = {} # phase -> seconds since t0, in the order marked
+        self.reported = False
+
+    def mark(self, phase):
+        '''Record when `phase` finished. Only the first mark of a phase counts.'''
+        self.marks.setdefault(phase, time.perf_counter() - self.t0)
+
+    def report(self):
+        '''Print the phases once, and warn if the first paint was over budget.'''
+        if self.reported:
+            return
+        self.reported = True
+        phases = ", ".join(f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in self.marks.items())
+        print(f'Startup: {phases}')
+
+        try:
+            budget = float(os.environ.get("OLLAMAGUI_STARTUP_BUDGET_MS", ""))
+        except ValueError:
+            return
+        painted = self.marks.get("first paint")
+        if painted is not None and painted * 1000 > budget:
+            print(f'Warning: first paint took {painted * 1000:.0f} ms, over the {budget:.0f} ms budget')
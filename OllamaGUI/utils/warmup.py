@@ -0,0 +1,117 @@
+# src/utils/warmup.py
+'''
+Load models ahead of the first prompt and keep them loaded while a window
+uses them.
+
+LLMProvider.load() brings the model into memory without generating anything
+(for Ollama, /api/generate with an empty prompt). `keep_alive` tells the
+server how long to keep it there afterwards. While a window holds a model, a
+background thread repeats the empty request before keep_alive runs out, so
+the model is not evicted in the middle of a session.
+'''
+
+import re
+import threading
+
+from .errors import LLMConnectionError
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
+def keep_alive_seconds(keep_alive):
+    '''
+    Convert an Ollama keep_alive value ("30m", "1h", "90s", 300, -1) to
+    seconds. Negative means forever, 0 means unload right away.
+    '''
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive)
+    total = 0.0
+    for number, unit in re.findall(r"(-?[\d.]+)\s*([hms]?)", str(keep_alive)):
+        total += float(number) * _UNITS[unit]
+    return total
+
+
+class ModelWarmer:
+    """
+    Preloads models and refreshes their keep_alive while they are held.
+
+    Parameters
+    ----------
+    provider : LLMProvider
+        Backend used for the warm-up requests.
+    keep_alive : str or int, optional
+        How long the server should keep a model loaded, Ollama syntax.
+    """
+    def __init__(self, provider, keep_alive=DEFAULT_KEEP_ALIVE):
+        self.provider = provider
+        self.keep_alive = keep_alive
+        self._held = {} # model -> [hold count, options]
+        self._loaded = set() # held models whose last warm() succeeded
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def refresh_interval(self):
+        '''Seconds between refreshes, comfortably before keep_alive expires.'''
+        return max(30.0, keep_alive_seconds(self.keep_alive) / 2)
+
+    def warm(self, model, options=None):
+        '''
+        Load `model` now. Blocks until the model is in memory, so call it from
+        a worker thread. Raises LLMConnectionError (or LLMUnreachableError)
+        if the server can't load it.
+        '''
+        print(f'Warming up {model} (keep_alive={self.keep_alive})') # debug
+        try:
+            reply = self.provider.load(model, options, keep_alive=self.keep_alive)
+        except LLMConnectionError:
+            with self._lock:
+                self._loaded.discard(model)
+            raise
+        with self._lock:
+            if model in self._held:
+                self._loaded.add(model)
+        return reply
+
+    def is_loaded(self, model):
+        '''True if `model` is held and was loaded by the last warm() (or refresh), no need to warm it again.'''
+        with self._lock:
+            return model in self._loaded
+
+    def hold(self, model, options=None):
+        '''Keep `model` loaded until release() is called as many times as hold().'''
+        with self._lock:
+            count, _ = self._held.get(model, (0, None))
+            self._held[model] = [count + 1, options]
+            if self._thread is None and keep_alive_seconds(self.keep_alive) > 0:
+                self._thread = threading.Thread(target=self._refresh_loop, name="ollamagui-keepalive", daemon=True)
+                self._thread.start()
+
+    def release(self, model):
+        with self._lock:
+            if model not in self._held:
+                return
+            self._held[model][0] -= 1
+            if self._held[model][0] <= 0:
+                del self._held[model]
+                self._loaded.discard(model)
+            if not self._held:
+                self._wake.set() # let the refresh thread exit
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(self.refresh_interval)
+            with self._lock:
+                self._wake.clear()
+                held = [(model, options) for model, (count, options) in self._held.items()]
+                if not held:
+                    self._thread = None
+                    return
+            for model, options in held:
+                try:
+                    self.warm(model, options)
+                except LLMConnectionError as e: # server down, the health check deals with that
+                    print(f'Keep-alive refresh for {model} failed: {e}')
@@ -0,0 +1,136 @@
+# src/utils/workers.py
+'''
+Run slow backend calls (generations, health checks, container commands) off
+the Tk main loop.
+
+Tkinter widgets may only be touched from the thread running mainloop(), so
+work is done on a thread pool and every result is put on a thread safe queue.
+The queue is drained on the Tk thread with `after()`, where the callbacks run.
+This module does not import tkinter, anything with an `after()` method works.
+'''
+
+import queue
+import threading
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor():
+    '''The thread pool shared by every window.'''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            import concurrent.futures # not needed before the first job, keeps start-up fast
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="ollamagui")
+        return _executor
+
+
+class TkWorker:
+    """
+    Submit work to the shared thread pool and get the results back on the Tk thread.
+
+    Parameters
+    ----------
+    widget : tk.Misc
+        Any widget, used for its `after()` method. Results are dropped once
+        close() has been called, so nothing touches a destroyed window.
+    poll_ms : int, optional
+        How often the result queue is drained while work is pending.
+    """
+    def __init__(self, widget, poll_ms=15):
+        self._widget = widget
+        self.poll_ms = poll_ms
+        self._results = queue.Queue()
+        self._pending = 0 # tasks submitted but not finished, only touched on the Tk thread
+        self._polling = False
+        self._closed = False
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def submit(self, func, *args, on_done=None, on_error=None, **kwargs):
+        '''
+        Run func(*args, **kwargs) in the background.
+
+        on_done(result) or on_error(exception) is then called on the Tk thread.
+        Returns the concurrent.futures.Future.
+        '''
+        def task():
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                self._post(self._finish, on_error, e)
+                raise
+            self._post(self._finish, on_done, result)
+            return result
+
+        return self._start(task)
+
+    def submit_iter(self, func, *args, on_item=None, on_done=None, on_error=None, **kwargs):
+        '''
+        Iterate over func(*args, **kwargs) in the background (e.g. a stream of
+        tokens) and call on_item(item) on the Tk thread for each item, in order.
+
+        on_done() or on_error(exception) is called once the iterator ends.
+        '''
+        def task():
+            try:
+                for item in func(*args, **kwargs):
+                    if self._closed:
+                        break
+                    self._post(on_item, item)
+            except BaseException as e:
+                self._post(self._finish, on_error, e)
+                raise
+            self._post(self._finish, on_done)
+
+        return self._start(task)
+
+    def call_soon(self, callback, *args):
+        '''
+        Thread safe: run callback(*args) on the Tk thread. Meant to be called
+        from inside a submitted task, results are only drained while busy.
+        '''
+        self._post(callback, *args)
+
+    def close(self):
+        '''Stop delivering results, e.g. because the window is being destroyed.'''
+        self._closed = True
+
+    #%% Internals
+    def _start(self, task):
+        self._pending += 1
+        future = shared_executor().submit(task)
+        self._schedule_poll()
+        return future
+
+    def _post(self, callback, *args):
+        if callback is not None and not self._closed:
+            self._results.put((callback, args))
+
+    def _finish(self, callback, *args):
+        self._pending -= 1
+        if callback is not None:
+            callback(*args)
+
+    def _schedule_poll(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self._widget.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        '''Runs on the Tk thread. Delivers queued results then re-arms itself while busy.'''
+        self._polling = False
+        while not self._closed:
+            try:
+                callback, args = self._results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e: # a broken callback must not stop the remaining ones
+                print(f'Error in background callback {callback!r}: {e!r}')
+        if self._pending > 0 or not self._results.empty():
+            self._schedule_poll()